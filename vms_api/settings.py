@@ -128,6 +128,24 @@ DATABASES = {
 # user model
 AUTH_USER_MODEL = 'vms_app.User'
 
+# the permission sets are cached (see vms_app/backends.py)
+AUTHENTICATION_BACKENDS = ['vms_app.backends.CachedModelBackend']
+
+# Cache
+# With several gunicorn workers use a shared cache (e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# and CACHE_LOCATION=redis://127.0.0.1:6379) so that invalidations reach every worker.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+PERMISSIONS_CACHE_TIMEOUT = config('PERMISSIONS_CACHE_TIMEOUT', default=300, cast=int)
+# company and shop lists: kept in the cache until a company or a shop changes,
+# and by the apps and proxies for CATALOG_CACHE_MAX_AGE seconds
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=86400, cast=int)
+CATALOG_CACHE_MAX_AGE = config('CATALOG_CACHE_MAX_AGE', default=300, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -188,6 +206,15 @@ CORS_ALLOW_HEADERS = (
     "content-type",
     "user-agent",
     "x-csrftoken",
+    "idempotency-key",
+    "if-none-match",
+    "if-modified-since",
+)
+
+# conditional GETs: let the apps read the validators
+CORS_EXPOSE_HEADERS = (
+    "etag",
+    "last-modified",
 )
 
 CORS_ALLOW_ALL_ORIGINS = False
@@ -208,13 +235,29 @@ else:
 # JWT SETUP
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'vms_app.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # orjson gives the same JSON as DRF's renderer, faster; MessagePack on 'Accept: application/msgpack'
+    'DEFAULT_RENDERER_CLASSES': [
+        'vms_app.renderers.ORJSONRenderer',
+        'vms_app.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'vms_app.parsers.ORJSONParser',
+        'vms_app.parsers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # ?fields= / ?omit= (see vms_app/fieldsets.py)
+    'DEFAULT_FILTER_BACKENDS': [
+        'vms_app.filters.SparseFieldsetFilter',
+    ],
 }
 
 SIMPLE_JWT = {
@@ -223,7 +266,28 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=config('REFRESH_TOKEN_LIFETIME', cast=int)),
     'BLACKLIST_AFTER_ROTATION': True,
     "UPDATE_LAST_LOGIN": True,
+    "TOKEN_OBTAIN_SERIALIZER": "vms_app.authentication.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "vms_app.authentication.ClaimsTokenRefreshSerializer",
+    "TOKEN_VERIFY_SERIALIZER": "vms_app.authentication.CachedBlacklistTokenVerifySerializer",
 }
+# access tokens carrying the user's claims, trusted without reading the user (see vms_app/authentication.py);
+# needs a cache shared by all the workers (CACHE_BACKEND), the startup fails otherwise
+JWT_STATELESS_CLAIMS = config('JWT_STATELESS_CLAIMS', default=False, cast=bool)
+
+# AUDIT TRAIL: entries are queued and written by batches (see vms_app/audit.py)
+AUDIT_TRAIL_BUFFERED = config('AUDIT_TRAIL_BUFFERED', default=True, cast=bool)
+AUDIT_FLUSH_INTERVAL = config('AUDIT_FLUSH_INTERVAL', default=2, cast=int)
+AUDIT_FLUSH_BATCH_SIZE = config('AUDIT_FLUSH_BATCH_SIZE', default=500, cast=int)
+# entries kept in memory while the database cannot be reached, the oldest are dropped beyond
+AUDIT_MAX_PENDING = config('AUDIT_MAX_PENDING', default=100000, cast=int)
+# months kept in the table, older ones are archived by `manage.py archive_audit_trail`
+AUDIT_TRAIL_RETENTION_MONTHS = config('AUDIT_TRAIL_RETENTION_MONTHS', default=12, cast=int)
+AUDIT_ARCHIVE_DIR = config('AUDIT_ARCHIVE_DIR', default=os.path.join(BASE_DIR, "audit_archive"))
+
+# IDEMPOTENCY KEYS (retried POSTs from tills and apps)
+IDEMPOTENCY_KEY_TTL = timedelta(hours=config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int))
+# longer than the worker timeout: a request still running after that is considered dead
+IDEMPOTENCY_KEY_LEASE = timedelta(seconds=config('IDEMPOTENCY_KEY_LEASE_SECONDS', default=120, cast=int))
 
 # DJOSER SETUP
 PASSWORD_RESET_CONFIRM_URL = 'vms/auth/reset_password/{uid}/{token}/'
@@ -3,6 +3,8 @@ from django.contrib.admin.models import LogEntry
 from django.contrib.auth import get_user_model
 from django import forms
 from django.contrib.auth.hashers import make_password
+from django.template.defaultfilters import linebreaksbr
+from django.utils import timezone
 
 from .models import (
     VoucherRequest, Shop,
@@ -52,7 +54,7 @@ class VoucherRequestAdmin(admin.ModelAdmin):
 
     def reject_selected_voucher_requests(self, request, queryset):
         if queryset.filter(request_status__in=['pending', 'paid']).exists():
-            queryset.filter(request_status__in=['pending', 'paid']).update(request_status='rejected')
+            queryset.filter(request_status__in=['pending', 'paid']).update(request_status='rejected', updated_at=timezone.now())
             self.message_user(request, "Selected voucher requests have been rejected.", level=messages.SUCCESS)
         else:
             self.message_user(
@@ -64,7 +66,7 @@ class VoucherRequestAdmin(admin.ModelAdmin):
     @admin.action(description="Approve selected requests")
     def approve_selected_voucher_requests(self, request, queryset):
         if queryset.filter(request_status='paid').exists():
-            queryset.filter(request_status='paid').update(request_status='approved')
+            queryset.filter(request_status='paid').update(request_status='approved', updated_at=timezone.now())
             self.message_user(request, "Selected voucher requests have been approved", level=messages.SUCCESS)
         else:
             self.message_user(
@@ -76,7 +78,7 @@ class VoucherRequestAdmin(admin.ModelAdmin):
     @admin.action(description="Mark selected requests as paid")
     def paid_selected_voucher_requests(self, request, queryset):
         if queryset.filter(request_status='pending').exists():
-            queryset.filter(request_status='pending').update(request_status='paid')
+            queryset.filter(request_status='pending').update(request_status='paid', updated_at=timezone.now())
             self.message_user(request, "Selected voucher requests have been paid", level=messages.SUCCESS)
         else:
             self.message_user(
@@ -170,9 +172,14 @@ class UserAdmin(admin.ModelAdmin):
 
 class AuditTrailAdmin(admin.ModelAdmin):
     list_display = ['user__username', 'action', 'table_name', 'datetime']
-    readonly_fields = ['id', 'user', 'action', 'table_name', 'datetime', 'description', 'object_id']
+    readonly_fields = ['id', 'user', 'action', 'table_name', 'datetime', 'rendered_description', 'object_id']
+    exclude = ['description', 'changes']
     list_per_page = 10
 
+    @admin.display(description='Description')
+    def rendered_description(self, obj):
+        return linebreaksbr(obj.rendered_description)
+
     def has_add_permission(self, request):
         return False
 
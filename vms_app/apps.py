@@ -7,3 +7,5 @@ class VmsAppConfig(AppConfig):
 
     def ready(self):
         import vms_app.signals
+        from vms_app.authentication import check_stateless_claims_cache
+        check_stateless_claims_cache()
@@ -0,0 +1,265 @@
+"""
+Buffered audit trail writer: the views queue their AuditTrail entries and they are
+written by batches with a single bulk INSERT, off the request path.
+
+- an entry logged inside a transaction is queued when the transaction commits
+  (and dropped if it is rolled back, like the row it describes);
+- the queue is written every AUDIT_FLUSH_INTERVAL seconds by a background thread,
+  as soon as it holds AUDIT_FLUSH_BATCH_SIZE entries, and at exit (once the thread
+  has finished its batch), so a clean shutdown of the process loses nothing;
+- a batch the database rejects is written row by row, and the rows it still rejects
+  are logged and dropped; when the database cannot be reached, the batch is kept for
+  the next flush, up to AUDIT_MAX_PENDING entries.
+- with AUDIT_TRAIL_BUFFERED = False the entries are written right away.
+
+Archival: the table only keeps the last AUDIT_TRAIL_RETENTION_MONTHS months. Older
+months are moved to one gzipped NDJSON file per month under AUDIT_ARCHIVE_DIR
+(archive_audit_trail command) and can be loaded back (restore_audit_trail).
+"""
+import atexit
+import gzip
+import logging
+import os
+import threading
+from datetime import date, datetime, time
+from pathlib import Path
+
+import orjson
+from django.conf import settings
+from django.db import DatabaseError, InterfaceError, OperationalError, connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class AuditTrailWriter:
+    def __init__(self):
+        self._entries = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'AUDIT_FLUSH_BATCH_SIZE', 500)
+
+    @property
+    def interval(self):
+        return getattr(settings, 'AUDIT_FLUSH_INTERVAL', 2)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'AUDIT_MAX_PENDING', 100000)
+
+    def log(self, entries):
+        """ queue unsaved AuditTrail instances (once the current transaction, if any, commits) """
+        if not entries:
+            return
+        if not getattr(settings, 'AUDIT_TRAIL_BUFFERED', True):
+            try:
+                self.write(entries)
+            except DatabaseError as e:
+                logger.error(f"Erreur lors de l'enregistrement de {len(entries)} entrées d'audit: {e}")
+        elif transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self.enqueue(entries))
+        else:
+            self.enqueue(entries)
+
+    def enqueue(self, entries):
+        with self._lock:
+            self._entries.extend(entries)
+            pending = len(self._entries)
+        flusher = self._ensure_flusher()
+        if pending >= self.batch_size:
+            if flusher:
+                self._wakeup.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        """ write every queued entry; returns how many were written """
+        with self._lock:
+            entries, self._entries = self._entries, []
+        if not entries:
+            return 0
+        try:
+            return self.write(entries)
+        except (OperationalError, InterfaceError) as e:
+            # the database is unreachable: kept for the next flush, within limits
+            with self._lock:
+                self._entries[:0] = entries
+                dropped = len(self._entries) - self.max_pending
+                if dropped > 0:
+                    del self._entries[:dropped]
+            logger.error(f"Erreur lors de l'enregistrement de {len(entries)} entrées d'audit: {e}")
+            if dropped > 0:
+                logger.error(f"{dropped} entrées d'audit perdues (AUDIT_MAX_PENDING atteint)")
+            return 0
+
+    def write(self, entries):
+        """ returns how many entries were written; a row the database rejects is logged and dropped """
+        from .models import AuditTrail
+        try:
+            with transaction.atomic():
+                AuditTrail.objects.bulk_create(entries, batch_size=self.batch_size)
+            return len(entries)
+        except (OperationalError, InterfaceError):
+            raise
+        except DatabaseError as e:
+            logger.error(f"Erreur lors de l'enregistrement de {len(entries)} entrées d'audit, une par une: {e}")
+
+        written = 0
+        for entry in entries:
+            try:
+                with transaction.atomic():
+                    entry.save(force_insert=True)
+                written += 1
+            except (OperationalError, InterfaceError):
+                raise
+            except DatabaseError as e:
+                logger.error(
+                    f"Entrée d'audit abandonnée ({entry.table_name} {entry.object_id}, "
+                    f"{entry.action}: {entry.description!r}): {e}"
+                )
+        return written
+
+    def shutdown(self):
+        """ stop the flusher, wait for the batch it may be writing, and write what is left (atexit) """
+        self._stopping = True
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            self._wakeup.set()
+            thread.join(timeout=30)
+        self.flush()
+
+    def _ensure_flusher(self):
+        """ start the background flusher if needed; False when there is none (interval 0, shutting down) """
+        if not self.interval or self._stopping:
+            return False
+        # one flusher per process (the thread does not survive a fork of the worker)
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='audit-trail-flusher', daemon=True)
+                self._thread.start()
+        return True
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopping:
+                # shutdown() writes what is left
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Erreur lors de l'enregistrement des entrées d'audit: {e}")
+            finally:
+                # connections are per thread: do not keep this one idle between flushes
+                connections.close_all()
+
+
+audit_writer = AuditTrailWriter()
+atexit.register(audit_writer.shutdown)
+
+
+
+ARCHIVE_FIELDS = ('id', 'datetime', 'user_id', 'table_name', 'object_id', 'description', 'changes', 'action')
+
+
+def month_start(month):
+    """ aware datetime of the first instant of `month` (a date) """
+    return timezone.make_aware(datetime.combine(month.replace(day=1), time.min))
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive_path(month, directory=None):
+    return Path(directory or settings.AUDIT_ARCHIVE_DIR) / f"audit_trail_{month:%Y-%m}.ndjson.gz"
+
+
+def read_archive(path):
+    with gzip.open(path, 'rb') as archive:
+        for line in archive:
+            if line.strip():
+                yield orjson.loads(line)
+
+
+def archivable_months(keep_months):
+    """ the months (first day) with entries older than the `keep_months` last ones, current one included """
+    from .models import AuditTrail
+    cutoff = add_months(timezone.localdate(), -keep_months + 1)
+    months = AuditTrail.objects.filter(datetime__lt=month_start(cutoff)).datetimes('datetime', 'month')
+    return [timezone.localtime(month).date() for month in months]
+
+
+def archive_month(month, directory=None, batch_size=5000):
+    """
+    Write the entries of `month` to its archive (merged with the file if the month was
+    archived before), then delete them from the table; returns the number archived.
+    """
+    from .models import AuditTrail
+    entries = AuditTrail.objects.filter(
+        datetime__gte=month_start(month), datetime__lt=month_start(add_months(month, 1))
+    )
+    path = archive_path(month, directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.part')
+
+    archived = 0
+    with gzip.open(partial, 'wb', compresslevel=6) as archive:
+        known_ids = set()
+        if path.exists():
+            for row in read_archive(path):
+                known_ids.add(row['id'])
+                archive.write(orjson.dumps(row) + b'\n')
+        for row in entries.order_by('pk').values(*ARCHIVE_FIELDS).iterator(chunk_size=batch_size):
+            archived += 1
+            if row['id'] not in known_ids:
+                archive.write(orjson.dumps(row) + b'\n')
+    # the previous archive is only replaced once the new one is complete
+    os.replace(partial, path)
+
+    # and the rows are only deleted once they are safely on disk
+    while True:
+        ids = list(entries.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return archived
+        AuditTrail.objects.filter(pk__in=ids).delete()
+
+
+def restore_month(month, directory=None, batch_size=5000):
+    """ load the archive of `month` back into the table (rows already there are skipped); returns the rows read """
+    from .models import AuditTrail, User
+    path = archive_path(month, directory)
+    if not path.exists():
+        raise FileNotFoundError(path)
+
+    def save(rows):
+        # the user may have been deleted since: the entry stays, unattributed
+        user_ids = {row['user_id'] for row in rows if row['user_id']}
+        existing = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        AuditTrail.objects.bulk_create([
+            AuditTrail(**{
+                **row,
+                'datetime': datetime.fromisoformat(row['datetime']),
+                'user_id': row['user_id'] if row['user_id'] in existing else None,
+            })
+            for row in rows
+        ], ignore_conflicts=True)
+
+    restored, rows = 0, []
+    for row in read_archive(path):
+        rows.append(row)
+        if len(rows) == batch_size:
+            save(rows)
+            restored, rows = restored + len(rows), []
+    if rows:
+        save(rows)
+    return restored + len(rows)
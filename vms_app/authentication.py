@@ -0,0 +1,202 @@
+"""
+Stateless JWT claims (JWT_STATELESS_CLAIMS = True).
+
+The access tokens then carry the user's id, username, company and is_staff/is_superuser,
+plus the version of their permissions (backends.get_permissions_version). As long as that
+version is still the current one in the cache, the request's user is built from the claims
+without reading the User row, and has_perm() reads the cached permissions: no query before
+the view. Any change to the user, their groups or permissions renews the version, and the
+tokens stamped before fall back to the regular lookup of the user in the database.
+
+Refresh token blacklist: the blacklist checks of the refresh and verify endpoints are
+answered from the cache (the valid tokens only with a shared cache), and
+`manage.py prune_tokens` deletes the expired tokens.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import router
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer, TokenRefreshSerializer, TokenVerifySerializer
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, UntypedToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .backends import get_permissions_version
+from .models import User
+
+PERMISSIONS_VERSION_CLAIM = 'pv'
+# User attribute -> claim
+USER_CLAIMS = {
+    'username': 'username',
+    'company_id': 'company',
+    'is_staff': 'is_staff',
+    'is_superuser': 'is_superuser',
+}
+
+
+# caches each worker process has its own copy of: an invalidation made in one worker
+# would never reach the others, which would keep trusting revoked claims
+PROCESS_LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def stateless_claims_enabled():
+    return getattr(settings, 'JWT_STATELESS_CLAIMS', False)
+
+
+def shared_cache_configured():
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
+
+
+def check_stateless_claims_cache():
+    """ refuse JWT_STATELESS_CLAIMS without a shared cache (called at startup, see apps.py) """
+    backend = settings.CACHES['default']['BACKEND']
+    if stateless_claims_enabled() and not shared_cache_configured():
+        raise ImproperlyConfigured(
+            f"JWT_STATELESS_CLAIMS needs a cache shared by all the workers (e.g. "
+            f"django.core.cache.backends.redis.RedisCache), not {backend}: set CACHE_BACKEND and CACHE_LOCATION."
+        )
+
+
+def stamp_claims(access, user):
+    """ the access token (a string) with the user's claims added """
+    token = AccessToken(access)
+    for attribute, claim in USER_CLAIMS.items():
+        token[claim] = getattr(user, attribute)
+    token[PERMISSIONS_VERSION_CLAIM] = get_permissions_version(user.pk)
+    return str(token)
+
+
+def user_from_claims(token):
+    """ the User of a token whose claims are still current, None otherwise """
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    version = token.get(PERMISSIONS_VERSION_CLAIM)
+    if not stateless_claims_enabled() or user_id is None or version is None:
+        return None
+    if version != get_permissions_version(user_id):
+        return None
+    # an instance loaded from the claims: the other fields are deferred, read from the
+    # database only if a view uses them
+    values = {'id': user_id, 'is_active': True, **{attribute: token[claim] for attribute, claim in USER_CLAIMS.items()}}
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(router.db_for_read(User), field_names, [values[name] for name in field_names])
+
+
+def blacklist_cache_key(jti):
+    return f"vms:jwt_blacklisted:{jti}"
+
+
+def seconds_until(expires_at):
+    return int((expires_at - timezone.now()).total_seconds())
+
+
+def cache_blacklisted(jti, expires_at):
+    """ remembered until the token expires: it can never be used again anyway """
+    timeout = seconds_until(expires_at)
+    if timeout > 0:
+        cache.set(blacklist_cache_key(jti), True, timeout)
+
+
+def uncache_blacklisted(jti):
+    cache.delete(blacklist_cache_key(jti))
+
+
+def is_blacklisted(jti, exp):
+    """
+    Whether the token `jti` (expiring at the `exp` timestamp) is blacklisted.
+
+    The blacklisted tokens are cached (by signals.py as soon as they are). A token seen as
+    valid is cached too when the cache is shared by all the workers: with add(), so it
+    never replaces the True set meanwhile by the worker blacklisting it. With a
+    process-local cache that worker could not update the others: the valid tokens are
+    then checked in the database every time.
+    """
+    cached = cache.get(blacklist_cache_key(jti))
+    if cached is not None:
+        return cached
+    blacklisted = BlacklistedToken.objects.filter(token__jti=jti).exists()
+    if blacklisted:
+        cache_blacklisted(jti, datetime_from_epoch(exp))
+    elif shared_cache_configured():
+        timeout = seconds_until(datetime_from_epoch(exp))
+        if timeout > 0:
+            cache.add(blacklist_cache_key(jti), False, timeout)
+    return blacklisted
+
+
+def prune_expired_tokens(batch_size=5000):
+    """
+    Delete the expired outstanding tokens (and their blacklist entries) in chunks of
+    `batch_size` rows; returns the number of tokens deleted. An expired token is
+    rejected on its exp claim alone, its rows are not needed any more.
+    """
+    deleted = 0
+    while True:
+        expired_ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=timezone.now())
+            .order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not expired_ids:
+            return deleted
+        OutstandingToken.objects.filter(pk__in=expired_ids).delete()
+        deleted += len(expired_ids)
+
+
+class RefreshToken(tokens.RefreshToken):
+    """ refresh token whose blacklist check is answered from the cache """
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM], self.payload['exp']):
+            raise TokenError(_("Token is blacklisted"))
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """ JWTAuthentication trusting the current claims of the token instead of loading the user """
+
+    def get_user(self, validated_token):
+        user = user_from_claims(validated_token)
+        if user is None:
+            return super().get_user(validated_token)
+        return user
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if stateless_claims_enabled():
+            data['access'] = stamp_claims(data['access'], self.user)
+        return data
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """ every new access token gets fresh claims (the stamp of the previous one may be stale) """
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        if stateless_claims_enabled():
+            access = AccessToken(data['access'])
+            user = User.objects.only('id', *USER_CLAIMS).get(pk=access[api_settings.USER_ID_CLAIM])
+            data['access'] = stamp_claims(data['access'], user)
+        return data
+
+
+class CachedBlacklistTokenVerifySerializer(TokenVerifySerializer):
+    def validate(self, attrs):
+        token = UntypedToken(attrs['token'])
+        if api_settings.BLACKLIST_AFTER_ROTATION and is_blacklisted(token.get(api_settings.JTI_CLAIM), token['exp']):
+            raise ValidationError("Token is blacklisted")
+        return {}
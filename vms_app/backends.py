@@ -0,0 +1,80 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+
+def permissions_cache_key(user_id):
+    return f"vms:user_permissions:{user_id}"
+
+
+def get_cached_permissions(user_id):
+    """
+    Effective permissions ('app_label.codename') a user gets through user_permissions
+    and groups, kept in the cache until signals.py invalidates them.
+    """
+    key = permissions_cache_key(user_id)
+    permissions = cache.get(key)
+    if permissions is None:
+        permissions = {
+            f"{app_label}.{codename}"
+            for app_label, codename in Permission.objects.filter(
+                Q(user__id=user_id) | Q(group__user__id=user_id)
+            ).values_list('content_type__app_label', 'codename').order_by().distinct()
+        }
+        cache.set(key, permissions, getattr(settings, 'PERMISSIONS_CACHE_TIMEOUT', 300))
+    return permissions
+
+
+def permissions_version_key(user_id):
+    return f"vms:user_permissions_version:{user_id}"
+
+
+def get_permissions_version(user_id):
+    """
+    Stamp of the current permissions (and claims, see authentication.py) of a user:
+    it changes whenever they are invalidated, which revokes the claims of the tokens
+    stamped before.
+    """
+    key = permissions_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+        # add: another worker may have just set it
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_cached_permissions(user_ids):
+    """
+    Drop the cached permissions of `user_ids` now (for the rest of the current transaction)
+    and again once it commits: a request reading the permissions in between would cache
+    the ones being revoked.
+    """
+    keys = [
+        key for user_id in user_ids for key in (permissions_cache_key(user_id), permissions_version_key(user_id))
+    ]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend reading the permission set from the cache, so has_perm() does not
+    query the user and group permission tables on every request.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if user_obj.is_superuser:
+            return super().get_all_permissions(user_obj, obj)
+        if not hasattr(user_obj, '_perm_cache'):
+            user_obj._perm_cache = get_cached_permissions(user_obj.pk)
+        return user_obj._perm_cache
@@ -0,0 +1,73 @@
+"""
+Response cache of the company and shop lists: read at every start of the mobile app,
+changed maybe once a month.
+
+Every cached response (any filter, any page) is keyed on a catalog version that
+signals.py renews whenever a Company or a Shop is saved or deleted, so a change
+drops all the variants at once without having to know them.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = "vms:catalog:version"
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add: another worker may have just set it
+        if not cache.add(CATALOG_VERSION_KEY, version, timeout=None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def invalidate_catalog():
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+class CachedCatalogMixin:
+    """
+    Serve `list` and `retrieve` from the cache (the serialized data, rendered in the
+    negotiated format), with public cache headers and an ETag answered without the database.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        query = "&".join(
+            f"{name}={value}" for name, values in sorted(request.query_params.lists()) for value in values
+        )
+        digest = hashlib.sha1(f"{get_catalog_version()}|{request.path}|{query}".encode()).hexdigest()
+        # one representation per format
+        accept = request.headers.get("Accept", "")
+        etag = f'"{hashlib.sha1(f"{digest}|{accept}".encode()).hexdigest()}"'
+
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponseNotModified()
+        else:
+            key = f"vms:catalog:response:{digest}"
+            data = cache.get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE)
+        # the payload is the same for everyone, only its format is negotiated
+        patch_vary_headers(response, ["Accept"])
+        return response
@@ -0,0 +1,123 @@
+"""
+Conditional GET (ETag / 304) of single objects.
+
+The validators are the `updated_at` (see ChangeTrackedModel) of the object and of the
+relations it embeds. When they are all single-valued (the object, its select_related
+relations) they are read from the object the view loads anyway: no query is added (and
+no validator is sent when ?fields= left them out).
+Otherwise they come from one aggregate over the rows the response is made of (the latest
+`updated_at` and the number of rows, which catches deletions), and the 304 is sent
+before anything is loaded or serialized.
+
+Lists are not conditional: an aggregate over the whole filtered table for every page
+would cost more than the page itself. There is no Last-Modified either: at the second
+precision of HTTP dates, a change made in the same second as the previous GET would be
+answered with a stale 304.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """
+    View mixin: `validator_fields` are the datetime fields, related ones included
+    ('redemption__updated_at'), whose latest value changes whenever the payload does.
+    """
+    validator_fields = ('updated_at',)
+
+    def detail_queryset(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self.get_queryset().filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+    def validators_are_single_valued(self):
+        """ whether every validator field is reached through forward or one-to-one relations only """
+        for field in self.validator_fields:
+            model = self.get_queryset().model
+            for name in field.split('__'):
+                model_field = model._meta.get_field(name)
+                if model_field.many_to_many or model_field.one_to_many:
+                    return False
+                model = model_field.related_model
+        return True
+
+    def make_etag(self, values):
+        """ etag of the validator `values` """
+        version = '|'.join([
+            self.request.get_full_path(),
+            self.request.headers.get('Accept', ''),
+            *(str(value) for value in values),
+        ])
+        return f'"{hashlib.sha1(version.encode()).hexdigest()}"'
+
+    def get_instance_etag(self, instance):
+        """
+        etag of the validators read from `instance` and its cached relations, None when one of them was
+        not loaded (deferred by ?fields=, relation not selected): it would cost a query
+        """
+        values = []
+        for field in self.validator_fields:
+            value = instance
+            for name in field.split('__'):
+                if value is None:
+                    break
+                if name in value._state.fields_cache:
+                    value = value._state.fields_cache[name]
+                elif name in value.get_deferred_fields() or value._meta.get_field(name).is_relation:
+                    return None
+                else:
+                    value = getattr(value, name)
+            values.append(value)
+        return self.make_etag(values)
+
+    def get_etag(self, queryset):
+        """ etag of the rows of `queryset`, None when there are none """
+        aggregates = {'rows': Count('pk', distinct=True)}
+        for index, field in enumerate(self.validator_fields):
+            aggregates[f'latest_{index}'] = Max(field)
+            relation, _, _ = field.rpartition('__')
+            if relation:
+                aggregates[f'related_{index}'] = Count(relation, distinct=True)
+        values = queryset.order_by().aggregate(**aggregates)
+        if not values['rows']:
+            return None
+        return self.make_etag(list(values.values()))
+
+    def conditional_response(self, request, etag, handler, *args, **kwargs):
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        # cached by the client, but revalidated every time
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def conditional_retrieve(self, request, handler, *args, **kwargs):
+        """
+        The object, or a 304 when the client's ETag is still valid.
+        `handler` answers the full GET when the validators need their own query.
+        """
+        if not self.validators_are_single_valued():
+            etag = self.get_etag(self.detail_queryset())
+            if etag is None:
+                # nothing there: let the handler answer its 404
+                return handler(request, *args, **kwargs)
+            return self.conditional_response(request, etag, handler, *args, **kwargs)
+
+        instance = self.get_object()
+        etag = self.get_instance_etag(instance)
+        serialize = lambda *args, **kwargs: Response(self.get_serializer(instance).data)
+        if etag is None:
+            return serialize()
+        return self.conditional_response(request, etag, serialize, *args, **kwargs)
+
+
+class ConditionalViewSetMixin(ConditionalGetMixin):
+    """ conditional `retrieve` for the router viewsets """
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_retrieve(request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,161 @@
+"""
+Sparse fieldsets: `?fields=id,voucher_ref,redemption.redeemed_on` keeps only the listed
+fields, `?omit=redemption,date_time_created` drops some; nested fields are reached with dots.
+
+Serializers get this from `SparseFieldsetMixin`, and `SparseFieldsetFilter` (filters.py)
+narrows the view's queryset to match: columns only read by omitted fields are deferred,
+and relations only read by omitted fields are no longer joined or prefetched.
+"""
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_QUERY_PARAM = 'fields'
+OMIT_QUERY_PARAM = 'omit'
+
+
+def parse_field_paths(value):
+    """ 'a,b.c,b.d' -> {'a': {}, 'b': {'c': {}, 'd': {}}} """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in filter(None, (name.strip() for name in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+class FieldSelection:
+    """ the fields requested from one serializer: `include` (None: all of them) minus `omit` """
+
+    def __init__(self, include=None, omit=None):
+        self.include = include
+        self.omit = omit or {}
+
+    @classmethod
+    def from_request(cls, request):
+        if request is None or request.method not in SAFE_METHODS:
+            return cls()
+        fields = request.query_params.get(FIELDS_QUERY_PARAM)
+        omit = request.query_params.get(OMIT_QUERY_PARAM)
+        return cls(
+            include=parse_field_paths(fields) if fields else None,
+            omit=parse_field_paths(omit) if omit else None,
+        )
+
+    def __bool__(self):
+        return self.include is not None or bool(self.omit)
+
+    def is_selected(self, name):
+        if self.include is not None and name not in self.include:
+            return False
+        # 'omit=redemption.user' only omits inside redemption
+        return not (name in self.omit and not self.omit[name])
+
+    def nested(self, name):
+        """ selection within the nested field `name` """
+        include = self.include.get(name) if self.include is not None else None
+        return FieldSelection(include=include or None, omit=self.omit.get(name))
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin applying the `fields`/`omit` query parameters (GET requests only).
+
+    Nested serializers declared as fields receive their part of the selection from their
+    parent; serializers built by a method field are given it with
+    `field_selection=self.field_selection.nested('<field>')`.
+
+    `Meta.field_sources` lists the model fields read by the fields whose source is not a
+    model field (method fields): they are needed to narrow the queryset.
+    """
+
+    def __init__(self, *args, field_selection=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._field_selection = field_selection
+
+    @property
+    def field_selection(self):
+        if self._field_selection is None:
+            root = self.root
+            if root is not self and isinstance(root, SparseFieldsetMixin):
+                # nested without a selection given by the parent: everything
+                self._field_selection = FieldSelection()
+            else:
+                self._field_selection = FieldSelection.from_request(self.context.get('request'))
+        return self._field_selection
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.field_selection
+        if not selection:
+            return fields
+        fields = {name: field for name, field in fields.items() if selection.is_selected(name)}
+        for name, field in fields.items():
+            nested = getattr(field, 'child', field)
+            if isinstance(nested, SparseFieldsetMixin):
+                nested._field_selection = selection.nested(name)
+        return fields
+
+    def get_field_sources(self, name, field):
+        """ first segment of the model fields read by `field`, None when unknown """
+        field_sources = getattr(self.Meta, 'field_sources', {})
+        if name in field_sources:
+            return {source.split('__')[0] for source in field_sources[name]}
+        # fields are not bound yet: no source means the field name
+        source = field.source or name
+        if isinstance(field, serializers.SerializerMethodField) or source == '*':
+            return None
+        return {source.split('.')[0]}
+
+    def narrow_queryset(self, queryset):
+        """ defer the columns and drop the relations only read by omitted fields """
+        selection = self.field_selection
+        if not selection:
+            return queryset
+
+        needed, owned = {queryset.model._meta.pk.name}, set()
+        for name, field in super().get_fields().items():
+            if field.write_only:
+                continue
+            sources = self.get_field_sources(name, field)
+            if sources is None:
+                # a field reading who knows what: leave the queryset alone
+                return queryset
+            owned |= sources
+            if selection.is_selected(name):
+                needed |= sources
+        unneeded = owned - needed
+        if not unneeded:
+            return queryset
+
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict) and unneeded & select_related.keys():
+            kept = {name: tree for name, tree in select_related.items() if name not in unneeded}
+            queryset = queryset.select_related(None)
+            if kept:
+                queryset = queryset.select_related(*relation_paths(kept))
+
+        prefetches = queryset._prefetch_related_lookups
+        kept = [lookup for lookup in prefetches if prefetch_root(lookup) not in unneeded]
+        if len(kept) != len(prefetches):
+            queryset = queryset.prefetch_related(None)
+            if kept:
+                queryset = queryset.prefetch_related(*kept)
+
+        columns = [
+            field.name for field in queryset.model._meta.concrete_fields
+            if field.name in unneeded
+        ]
+        return queryset.defer(*columns) if columns else queryset
+
+
+def relation_paths(tree, prefix=''):
+    """ {'a': {'b': {}}, 'c': {}} -> ['a__b', 'c'] (select_related arguments) """
+    paths = []
+    for name, subtree in tree.items():
+        path = f'{prefix}{name}'
+        paths += relation_paths(subtree, f'{path}__') if subtree else [path]
+    return paths
+
+
+def prefetch_root(lookup):
+    return getattr(lookup, 'prefetch_through', lookup).split('__')[0]
@@ -0,0 +1,74 @@
+from django.db import connection
+from rest_framework import filters
+
+from .fieldsets import SparseFieldsetMixin, FIELDS_QUERY_PARAM, OMIT_QUERY_PARAM
+
+
+class VoucherRefSearchFilter(filters.SearchFilter):
+    """
+    Search on refs ('PREFIX-YY-NNNN', always upper case) by prefix.
+
+    The terms are upper-cased so the view can use a case-sensitive
+    `voucher_ref__startswith` lookup: a LIKE 'TERM%' that the
+    text_pattern_ops "_like" index PostgreSQL builds along with the
+    unique index on voucher_ref answers, instead of an ICONTAINS that
+    scans the whole table.
+    """
+
+    def get_search_terms(self, request):
+        return [term.upper() for term in super().get_search_terms(request)]
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    `?search=` as a PostgreSQL full-text search over the `search_fields` (web search
+    syntax: words, "quoted phrases", -excluded), answered by the GIN index on
+    to_tsvector('simple', ...) that migration 0012 creates for the audit descriptions.
+    Other databases keep the ICONTAINS search of SearchFilter.
+    """
+    search_config = 'simple'
+
+    def filter_queryset(self, request, queryset, view):
+        if connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+        from django.contrib.postgres.search import SearchQuery, SearchVector
+
+        search = request.query_params.get(self.search_param, '').strip()
+        search_fields = self.get_search_fields(view, request)
+        if not search or not search_fields:
+            return queryset
+        # same expression as the index, or it is not used
+        vector = SearchVector(*search_fields, config=self.search_config)
+        query = SearchQuery(search, config=self.search_config, search_type='websearch')
+        return queryset.annotate(search_vector=vector).filter(search_vector=query)
+
+
+class SparseFieldsetFilter(filters.BaseFilterBackend):
+    """
+    Narrow the queryset to the fields requested with `?fields=`/`?omit=`
+    (see fieldsets.py): the serializer knows which columns and relations they read.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        serializer = view.get_serializer()
+        if isinstance(serializer, SparseFieldsetMixin):
+            return serializer.narrow_queryset(queryset)
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': FIELDS_QUERY_PARAM,
+                'required': False,
+                'in': 'query',
+                'description': "Comma separated fields to return, nested ones with dots (e.g. 'id,redemption.redeemed_on')",
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': OMIT_QUERY_PARAM,
+                'required': False,
+                'in': 'query',
+                'description': "Comma separated fields to leave out, nested ones with dots",
+                'schema': {'type': 'string'},
+            },
+        ]
@@ -0,0 +1,133 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def get_idempotency_key_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+
+
+def get_idempotency_key_lease():
+    return getattr(settings, 'IDEMPOTENCY_KEY_LEASE', timedelta(minutes=2))
+
+
+def request_fingerprint(request):
+    """ hash of the method, path and body, to detect a key reused for a different request """
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def idempotent(view_method):
+    """
+    Make a POST handler idempotent for clients sending an 'Idempotency-Key' header.
+
+    The first response (anything but a server error) is stored under the key for
+    IDEMPOTENCY_KEY_TTL; a retry with the same key and body gets that response back
+    without running the view again. Requests without the header are not affected.
+
+    While the first request runs, the key is leased for IDEMPOTENCY_KEY_LEASE: retries get
+    a 409 until then, and may take the key over once the lease has run out (the worker
+    running the request died or was killed before storing its response).
+    """
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(view, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {"detail": f"The {IDEMPOTENCY_HEADER} header must be at most 255 characters."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fingerprint = request_fingerprint(request)
+        now = timezone.now()
+        stored = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if stored and stored.expires_at <= now:
+            stored.delete()
+            stored = None
+        if stored and not take_over_abandoned(stored, fingerprint, now):
+            return replay_response(stored, fingerprint)
+
+        if not stored:
+            try:
+                with transaction.atomic():
+                    stored = IdempotencyKey.objects.create(
+                        user=request.user, key=key,
+                        request_fingerprint=fingerprint,
+                        expires_at=now + get_idempotency_key_ttl(),
+                        locked_until=now + get_idempotency_key_lease(),
+                    )
+            except IntegrityError:
+                # the same key was stored by a concurrent request in the meantime
+                return Response(
+                    {"detail": "A request with this Idempotency-Key is already being processed."},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+        try:
+            response = view_method(view, request, *args, **kwargs)
+        except Exception:
+            stored.delete()
+            raise
+
+        if response.status_code >= 500:
+            # server errors are not final: let the client retry with the same key
+            stored.delete()
+        else:
+            stored.response_status = response.status_code
+            # stored as rendered by the JSON renderer so a replay is identical
+            stored.response_body = json.loads(JSONRenderer().render(response.data) or b'null')
+            stored.locked_until = None
+            stored.save(update_fields=['response_status', 'response_body', 'locked_until'])
+        return response
+
+    return wrapper
+
+
+def take_over_abandoned(stored, fingerprint, now):
+    """
+    Lease again a key whose request never stored its response and whose lease ran out;
+    False if it is finished, still leased, used for another request, or taken by a concurrent retry.
+    """
+    if stored.response_status is not None or stored.request_fingerprint != fingerprint:
+        return False
+    if stored.locked_until is not None and stored.locked_until > now:
+        return False
+    locked_until = now + get_idempotency_key_lease()
+    # conditional UPDATE: only one of several concurrent retries gets it
+    taken = IdempotencyKey.objects.filter(
+        pk=stored.pk, response_status__isnull=True, locked_until=stored.locked_until
+    ).update(locked_until=locked_until)
+    stored.locked_until = locked_until
+    return bool(taken)
+
+
+def replay_response(stored, fingerprint):
+    if stored.request_fingerprint != fingerprint:
+        return Response(
+            {"detail": "This Idempotency-Key has already been used for a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if stored.response_status is None:
+        return Response(
+            {"detail": "A request with this Idempotency-Key is already being processed."},
+            status=status.HTTP_409_CONFLICT
+        )
+    return Response(stored.response_body, status=stored.response_status, headers={REPLAYED_HEADER: 'true'})
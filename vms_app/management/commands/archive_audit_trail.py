@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from vms_app.audit import archivable_months, archive_month, archive_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the audit trail entries older than the retention period to one gzipped NDJSON "
+        "file per month (run it monthly, e.g. from cron). See restore_audit_trail to load a month back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-months', type=int, default=settings.AUDIT_TRAIL_RETENTION_MONTHS,
+            help="Number of months kept in the table, the current one included "
+                 f"(default: AUDIT_TRAIL_RETENTION_MONTHS, {settings.AUDIT_TRAIL_RETENTION_MONTHS})"
+        )
+        parser.add_argument(
+            '--directory', default=None,
+            help="Directory of the archives (default: AUDIT_ARCHIVE_DIR)"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help="Number of entries read and deleted per query (default: 5000)"
+        )
+
+    def handle(self, *args, **options):
+        if options['keep_months'] < 1:
+            raise CommandError("--keep-months must be at least 1")
+        total = 0
+        for month in archivable_months(options['keep_months']):
+            archived = archive_month(month, options['directory'], options['batch_size'])
+            total += archived
+            self.stdout.write(f"{month:%Y-%m}: {archived} entries -> {archive_path(month, options['directory'])}")
+        self.stdout.write(self.style.SUCCESS(f"Archived {total} audit trail entries."))
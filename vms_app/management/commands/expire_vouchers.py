@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from vms_app.models import AuditTrail, Voucher
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the issued vouchers past their expiry (or extension) date to 'expired'. "
+        "Safe to run every few minutes, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of vouchers updated per UPDATE statement (default: 1000)"
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        expired = Voucher.expire_overdue(today=today, batch_size=options['batch_size'])
+        if expired:
+            # one summarised entry per run instead of one per voucher
+            AuditTrail.objects.create(
+                user=None,
+                table_name=Voucher.__name__,
+                action=AuditTrail.AuditTrailsAction.UPDATE,
+                description=f"Expired {expired} issued vouchers whose validity ended before {today:%Y-%m-%d}.",
+            )
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} vouchers."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from vms_app.authentication import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the expired JWT refresh tokens and their blacklist entries in chunks "
+        "(run it periodically, e.g. daily from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help="Number of tokens deleted per DELETE statement (default: 5000)"
+        )
+
+    def handle(self, *args, **options):
+        deleted = prune_expired_tokens(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired tokens."))
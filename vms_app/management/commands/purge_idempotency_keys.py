@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from vms_app.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete the expired idempotency keys (run it periodically, e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help="Number of keys deleted per DELETE statement (default: 5000)"
+        )
+
+    def handle(self, *args, **options):
+        deleted = IdempotencyKey.purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys."))
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vms_app.audit import restore_month
+
+
+def month(value):
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise CommandError(f"'{value}' is not a month (YYYY-MM)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Load archived months of the audit trail back into the table. "
+        "They are archived again by the next archive_audit_trail run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('months', nargs='+', help="Months to restore (YYYY-MM)")
+        parser.add_argument(
+            '--directory', default=None,
+            help="Directory of the archives (default: AUDIT_ARCHIVE_DIR)"
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help="Number of entries inserted per query (default: 5000)"
+        )
+
+    def handle(self, *args, **options):
+        for value in options['months']:
+            try:
+                restored = restore_month(month(value), options['directory'], options['batch_size'])
+            except FileNotFoundError as e:
+                raise CommandError(f"No archive for {value}: {e}")
+            self.stdout.write(self.style.SUCCESS(f"{value}: restored {restored} audit trail entries."))
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.5 on 2026-10-16 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms_app', '0002_alter_client_brn_alter_client_vat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('voucher', 'Voucher'), ('request', 'Voucher request')], max_length=10)),
+                ('prefix', models.CharField(blank=True, default='', max_length=3)),
+                ('year', models.CharField(max_length=2)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'prefix', 'year'), name='unique_ref_sequence')],
+            },
+        ),
+    ]
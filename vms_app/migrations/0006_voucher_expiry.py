@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-16 23:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms_app', '0005_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='audittrail',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='audit_trails', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(condition=models.Q(('voucher_status', 'issued')), fields=['expiry_date'], name='issued_voucher_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voucher',
+            index=models.Index(condition=models.Q(('voucher_status', 'issued')), fields=['extention_date'], name='issued_voucher_extension_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-16 23:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms_app', '0006_voucher_expiry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='voucherrequest',
+            index=models.Index(fields=['client', '-date_time_recorded', '-id'], name='request_client_recorded_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.5 on 2026-10-16 23:51
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_content_hashes(apps, schema_editor):
+    for model_name, blob_field, hash_field in (
+        ('Company', 'company_logo', 'company_logo_hash'),
+        ('Client', 'logo', 'logo_hash'),
+        ('User', 'signature', 'signature_hash'),
+    ):
+        model = apps.get_model('vms_app', model_name)
+        rows = model.objects.exclude(**{f'{blob_field}__isnull': True}).values_list('pk', blob_field)
+        for pk, blob in rows.iterator(chunk_size=100):
+            if blob:
+                model.objects.filter(pk=pk).update(**{hash_field: hashlib.sha256(blob).hexdigest()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms_app', '0007_request_client_recorded_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='logo_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='company_logo_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='signature_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_content_hashes, migrations.RunPython.noop),
+    ]
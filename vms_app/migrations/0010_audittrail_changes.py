@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms_app', '0009_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audittrail',
+            name='changes',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
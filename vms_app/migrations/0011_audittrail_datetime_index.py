@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms_app', '0010_audittrail_changes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audittrail',
+            index=models.Index(fields=['datetime'], name='audit_datetime_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:23
+
+from django.db import migrations, models
+
+DESCRIPTION_SEARCH_INDEX = 'audit_description_search_idx'
+
+
+def description_search_index():
+    # the expression FullTextSearchFilter filters on (vms_app/filters.py)
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+    return GinIndex(SearchVector('description', config='simple'), name=DESCRIPTION_SEARCH_INDEX)
+
+
+def add_description_search_index(apps, schema_editor):
+    # PostgreSQL only: the other databases keep the ICONTAINS search, without index
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('vms_app', 'AuditTrail'), description_search_index())
+
+
+def remove_description_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('vms_app', 'AuditTrail'), description_search_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms_app', '0011_audittrail_datetime_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='audittrail',
+            index=models.Index(fields=['table_name', 'object_id', 'datetime'], name='audit_object_datetime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='audittrail',
+            index=models.Index(fields=['user', 'datetime'], name='audit_user_datetime_idx'),
+        ),
+        migrations.RunPython(add_description_search_index, remove_description_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.5 on 2026-10-17 00:58
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vms_app', '0013_idempotencykey_locked_until'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='voucherrequest',
+            name='quantity_of_vouchers',
+            field=models.IntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
@@ -1,17 +1,73 @@
+import hashlib
+
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError, PermissionDenied
-from django.core.validators import MaxValueValidator
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models, transaction, IntegrityError
+from django.db.models import F
 from django.utils import timezone
 from django.utils.timezone import localtime
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
 
-class Company(models.Model):
+# Number of rows sent per INSERT when vouchers are created in bulk
+VOUCHER_BULK_CREATE_BATCH_SIZE = 500
+
+
+def content_hash(blob):
+    """ sha256 hex digest identifying the content of a binary field (None when empty) """
+    if not blob:
+        return None
+    return hashlib.sha256(blob).hexdigest()
+
+
+class ContentHashMixin:
+    """
+    Keep a hash of binary fields up to date on save: `content_hash_fields` maps
+    each binary field to the field storing its hash (used to serve it with an ETag).
+    """
+    content_hash_fields = {}
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        deferred_fields = self.get_deferred_fields()
+        for blob_field, hash_field in self.content_hash_fields.items():
+            if blob_field in deferred_fields:
+                # not loaded, so it cannot have been changed
+                continue
+            if update_fields is not None:
+                if blob_field not in update_fields:
+                    continue
+                kwargs['update_fields'] = update_fields = {*update_fields, hash_field}
+            setattr(self, hash_field, content_hash(getattr(self, blob_field)))
+        super().save(*args, **kwargs)
+
+
+class ChangeTrackedModel(models.Model):
+    """
+    `updated_at` is bumped on every save, update_fields included; the querysets
+    updating tracked rows set it themselves. It validates conditional GETs.
+    """
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        super().save(*args, **kwargs)
+
+
+class Company(ContentHashMixin, ChangeTrackedModel):
+    content_hash_fields = {'company_logo': 'company_logo_hash'}
+
     company_name = models.CharField(max_length=70)
     prefix = models.CharField(max_length=3, blank=True, null=True )
     company_logo = models.BinaryField(blank=True, null=True)
+    company_logo_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
     vat = models.CharField(max_length=8, blank=True, null=True)
     brn = models.CharField(max_length=9, blank=True, null=True)
     address = models.CharField(max_length=100, blank=True, null=True)
@@ -25,7 +81,7 @@ class Company(models.Model):
         return self.company_name
 
 
-class Shop(models.Model):
+class Shop(ChangeTrackedModel):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='shops')
     location = models.CharField(max_length=100)
     address = models.CharField(max_length=150, blank=True, null=True)
@@ -37,8 +93,9 @@ class Shop(models.Model):
         return f"{self.company.company_name} {self.location}"
 
 
-class User(AbstractUser):
+class User(ContentHashMixin, ChangeTrackedModel, AbstractUser):
     REQUIRED_FIELDS = ['email']
+    content_hash_fields = {'signature': 'signature_hash'}
 
     class Meta:
         ordering = ['username', 'email']
@@ -51,12 +108,69 @@ class User(AbstractUser):
     )
 
     signature = models.BinaryField(blank=True, null=True)
+    signature_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
 
     def __str__(self):
         return self.username
 
 
-class Client(models.Model):
+class RefSequence(models.Model):
+    """Counter handing out the sequence numbers of voucher and request refs."""
+    class SequenceKind(models.TextChoices):
+        VOUCHER = 'voucher', 'Voucher'
+        REQUEST = 'request', 'Voucher request'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'prefix', 'year'],
+                name='unique_ref_sequence'
+            ),
+        ]
+
+    kind = models.CharField(max_length=10, choices=SequenceKind.choices)
+    prefix = models.CharField(max_length=3, blank=True, default='')
+    year = models.CharField(max_length=2)
+    last_value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def reserve(cls, kind, prefix, year, count=1, initial=None):
+        """
+        Atomically reserve `count` consecutive numbers and return the first one.
+
+        The counter row is incremented with a single UPDATE, which takes a row lock
+        held until the surrounding transaction ends: concurrent workers queue on
+        that lock and can never receive the same number. `initial` is called only
+        when the counter does not exist yet, to continue from refs already in use.
+
+        Call it outside of long transactions: the lock is only released when the
+        outermost one ends. The numbers then stay reserved even if what they were
+        reserved for is not created: refs can have gaps.
+        """
+        if count < 1:
+            # 0 would return a number that is not reserved, a negative count would move the counter back
+            raise ValueError(f"At least one number must be reserved, got {count}.")
+        lookup = {'kind': kind, 'prefix': prefix, 'year': year}
+        with transaction.atomic():
+            updated = cls.objects.filter(**lookup).update(last_value=F('last_value') + count)
+            if not updated:
+                start = initial() if initial else 0
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(**lookup, last_value=start + count)
+                except IntegrityError:
+                    # another worker created the counter first
+                    cls.objects.filter(**lookup).update(last_value=F('last_value') + count)
+            last_value = cls.objects.filter(**lookup).values_list('last_value', flat=True).get()
+        return last_value - count + 1
+
+    def __str__(self):
+        return f"{self.kind} {self.prefix}-{self.year}: {self.last_value}"
+
+
+class Client(ContentHashMixin, ChangeTrackedModel):
+    content_hash_fields = {'logo': 'logo_hash'}
+
     iscompany = models.BooleanField(default=True)
     clientname = models.CharField(max_length=70)
     vat = models.CharField(max_length=8, blank=True, null=True)
@@ -65,6 +179,7 @@ class Client(models.Model):
     email = models.EmailField(max_length=50)
     contact = models.CharField(max_length=70)
     logo = models.BinaryField(blank=True, null=True)
+    logo_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
 
     class Meta:
         ordering = ['clientname']
@@ -73,7 +188,7 @@ class Client(models.Model):
         return f"{self.clientname}"
 
 
-class VoucherRequest(models.Model):
+class VoucherRequest(ChangeTrackedModel):
     class RequestStatus(models.TextChoices):
         PENDING = 'pending', 'Pending'
         PAID = 'paid', 'Paid'
@@ -87,10 +202,14 @@ class VoucherRequest(models.Model):
             ("approve_request", "Can approve a voucher request"),
             ("change_to_paid", "Can change the request_status from pending to paid"),
         ]
+        indexes = [
+            # latest requests of a client (client detail and its voucher_requests sub-resource)
+            models.Index(fields=['client', '-date_time_recorded', '-id'], name='request_client_recorded_idx'),
+        ]
 
     request_ref = models.TextField(unique=True, blank=True, null=True)
     date_time_recorded = models.DateTimeField(default=timezone.now, blank=True)
-    quantity_of_vouchers = models.IntegerField(blank=False, null=False, default=1)
+    quantity_of_vouchers = models.IntegerField(blank=False, null=False, default=1, validators=[MinValueValidator(1)])
     amount = models.IntegerField(null=True, blank=True)
     request_status = models.CharField(max_length=20, choices=RequestStatus.choices, default=RequestStatus.PENDING)
     date_time_approved = models.DateTimeField(null=True, blank=True)
@@ -133,15 +252,9 @@ class VoucherRequest(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.request_ref and self.company:
-            for _ in range(5):  # On réessaie jusqu’à 5 fois
-                try:
-                    with transaction.atomic():
-                        self.request_ref = self.generate_request_ref()
-                        super().save(*args, **kwargs)
-                        return
-                except IntegrityError:
-                    continue
-            raise IntegrityError("Failed to generate a unique request_ref after multiple attempts.")
+            with transaction.atomic():
+                self.request_ref = self.generate_request_ref()
+                super().save(*args, **kwargs)
         else:
             super().save(*args, **kwargs)
 
@@ -149,23 +262,62 @@ class VoucherRequest(models.Model):
         year_suffix = timezone.now().strftime('%y')
         company_prefix = self.company.prefix.upper()
 
-        # Get all refs from the current year (regardless of company)
-        year_start = timezone.now().replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-        all_refs = VoucherRequest.objects.filter(
-            date_time_recorded__gte=year_start
+        # The sequence is shared by all companies and restarts every year
+        sequence = RefSequence.reserve(
+            RefSequence.SequenceKind.REQUEST, '', year_suffix,
+            initial=lambda: VoucherRequest.last_request_sequence(year_suffix)
+        )
+        return f"VRQ-{company_prefix}-{year_suffix}-#{sequence}"
+
+    @staticmethod
+    def last_request_sequence(year_suffix):
+        """
+        Highest sequence already used in year 'YY', compared as numbers.
+        Only used once per year to seed the counter from existing refs.
+        """
+        refs = VoucherRequest.objects.filter(
+            request_ref__contains=f"-{year_suffix}-#"
         ).values_list('request_ref', flat=True)
 
-        sequence = 1
-        for ref in sorted(all_refs, reverse=True):
+        max_seq = 0
+        for ref in refs:
             try:
                 parts = ref.split('-')
                 if len(parts) == 4 and parts[2] == year_suffix:
-                    sequence = int(parts[3].replace('#', '')) + 1
-                    break
-            except Exception:
+                    max_seq = max(max_seq, int(parts[3].replace('#', '')))
+            except ValueError:
                 continue
-
-        return f"VRQ-{company_prefix}-{year_suffix}-#{sequence}"
+        return max_seq
+
+    def reserve_refs(self):
+        """
+        Reserve the request ref of this unsaved request and the block of refs of its vouchers,
+        each in a short transaction of its own. Call it before the transaction that writes
+        the request: the counters are then not locked while the vouchers are inserted.
+        Returns the voucher refs, to pass to create_provisional_vouchers().
+        """
+        if self.company:
+            self.request_ref = self.generate_request_ref()
+        return Voucher.generate_voucher_refs(self.company, self.quantity_of_vouchers)
+
+    def create_provisional_vouchers(self, refs=None):
+        """
+        Materialise `quantity_of_vouchers` provisional vouchers for this request:
+        the refs are reserved as one block (unless already reserved by reserve_refs())
+        and the rows are written with batched INSERTs instead of one save() per voucher.
+        """
+        if refs is None:
+            refs = Voucher.generate_voucher_refs(self.company, self.quantity_of_vouchers)
+        vouchers = [
+            Voucher(
+                voucher_request=self,
+                voucher_ref=ref,
+                amount=self.amount,
+                voucher_status=Voucher.VoucherStatus.PROVISIONAL,
+            )
+            for ref in refs
+        ]
+        return Voucher.objects.bulk_create(vouchers, batch_size=VOUCHER_BULK_CREATE_BATCH_SIZE)
 
     def clean(self):
         if self.pk:
@@ -183,7 +335,11 @@ class VoucherRequest(models.Model):
     def __str__(self):
         return f"Voucher Request ref: {self.request_ref}"
 
-class Voucher(models.Model):
+class RedemptionConflict(ValueError):
+    """Raised when a voucher was redeemed (possibly by another till) before this redemption."""
+
+
+class Voucher(ChangeTrackedModel):
     class VoucherStatus(models.TextChoices):
         PROVISIONAL = 'provisional', 'Provisional'
         ISSUED = 'issued', 'Issued'
@@ -193,6 +349,17 @@ class Voucher(models.Model):
     class Meta:
         ordering = ['voucher_ref']
         permissions = [("redeem_voucher", "Can redeem voucher")]
+        indexes = [
+            # only 'issued' vouchers can expire: keep the expiry indexes limited to them
+            models.Index(
+                fields=['expiry_date'], name='issued_voucher_expiry_idx',
+                condition=models.Q(voucher_status='issued')
+            ),
+            models.Index(
+                fields=['extention_date'], name='issued_voucher_extension_idx',
+                condition=models.Q(voucher_status='issued')
+            ),
+        ]
 
     voucher_request = models.ForeignKey(VoucherRequest, on_delete=models.CASCADE, related_name='vouchers')
     voucher_ref = models.TextField(unique=True, null=True, blank=True)
@@ -203,17 +370,107 @@ class Voucher(models.Model):
     voucher_status = models.CharField(max_length=20, choices=VoucherStatus.choices, default=VoucherStatus.PROVISIONAL)
 
     def redeem(self, user, shop, till_no):
-        """Redeem the voucher by creating a Redemption and updating status."""
+        """
+        Redeem the voucher by creating a Redemption and updating status.
+
+        The 'issued' -> 'redeemed' transition is a single conditional UPDATE done in
+        the same short transaction as the Redemption insert, so when two tills race
+        on the same voucher only one of them wins; the other gets RedemptionConflict.
+        """
         if not user.has_perm('vms_app.redeem_voucher'):
             raise PermissionDenied("You do not have permission to redeem vouchers.")
 
+        if self.voucher_status == Voucher.VoucherStatus.REDEEMED:
+            raise RedemptionConflict("Voucher has already been redeemed.")
         if self.voucher_status != Voucher.VoucherStatus.ISSUED:
             raise ValueError("Voucher must be issued to be redeemed.")
-        # Create the Redemption
-        Redemption.objects.create(voucher=self, user=user, shop=shop, till_no=till_no)
-        # Update voucher status to redeemed
+
+        with transaction.atomic():
+            redeemed = Voucher.objects.filter(
+                pk=self.pk, voucher_status=Voucher.VoucherStatus.ISSUED
+            ).update(voucher_status=Voucher.VoucherStatus.REDEEMED, updated_at=timezone.now())
+            if not redeemed:
+                raise RedemptionConflict("Voucher is no longer available for redemption.")
+            # Create the Redemption
+            redemption = Redemption.objects.create(voucher=self, user=user, shop=shop, till_no=till_no)
+
         self.voucher_status = Voucher.VoucherStatus.REDEEMED
-        self.save()
+        return redemption
+
+    @classmethod
+    def redeem_many(cls, vouchers, user, shop, till_no):
+        """
+        Redeem several vouchers at once with set-based queries.
+        Returns (redemptions, conflicts), conflicts being the vouchers that were no longer issued.
+        """
+        redemptions, conflicts = cls.apply_redemptions([
+            Redemption(voucher=voucher, user=user, shop=shop, till_no=till_no)
+            for voucher in vouchers
+        ])
+        return redemptions, [redemption.voucher for redemption in conflicts]
+
+    @classmethod
+    def apply_redemptions(cls, redemptions):
+        """
+        Save unsaved Redemptions with set-based queries, following the rules of redeem().
+
+        The vouchers still 'issued' are locked, switched to 'redeemed' with one UPDATE
+        and the Redemptions written with one INSERT. Only the first redemption of a
+        voucher is applied, so callers pass them in chronological order.
+        Returns (applied, conflicts), conflicts being the redemptions not applied
+        because their voucher was no longer issued.
+        """
+        for user in {redemption.user for redemption in redemptions}:
+            if not user.has_perm('vms_app.redeem_voucher'):
+                raise PermissionDenied("You do not have permission to redeem vouchers.")
+
+        applied, conflicts = [], []
+        with transaction.atomic():
+            issued_ids = set(
+                cls.objects.select_for_update().filter(
+                    pk__in=[redemption.voucher_id for redemption in redemptions],
+                    voucher_status=Voucher.VoucherStatus.ISSUED
+                ).order_by('pk').values_list('pk', flat=True)
+            )
+            for redemption in redemptions:
+                if redemption.voucher_id in issued_ids:
+                    issued_ids.discard(redemption.voucher_id)
+                    applied.append(redemption)
+                else:
+                    conflicts.append(redemption)
+
+            cls.objects.filter(
+                pk__in=[redemption.voucher_id for redemption in applied]
+            ).update(voucher_status=Voucher.VoucherStatus.REDEEMED, updated_at=timezone.now())
+            Redemption.objects.bulk_create(applied)
+
+        for redemption in applied:
+            redemption.voucher.voucher_status = Voucher.VoucherStatus.REDEEMED
+        return applied, conflicts
+
+    @classmethod
+    def expire_overdue(cls, today=None, batch_size=1000):
+        """
+        Move the 'issued' vouchers whose validity is over to 'expired', `batch_size`
+        rows per UPDATE so that each statement only holds its locks briefly.
+        The extention_date, when set, replaces the expiry_date.
+        Returns the number of vouchers expired.
+        """
+        today = today or timezone.localdate()
+        overdue = cls.objects.filter(
+            models.Q(extention_date__isnull=True, expiry_date__lt=today) | models.Q(extention_date__lt=today),
+            voucher_status=Voucher.VoucherStatus.ISSUED,
+        ).order_by()
+
+        expired = 0
+        while True:
+            overdue_ids = list(overdue.values_list('pk', flat=True)[:batch_size])
+            if not overdue_ids:
+                return expired
+            # the status is checked again in case a voucher was redeemed in the meantime
+            expired += cls.objects.filter(
+                pk__in=overdue_ids, voucher_status=Voucher.VoucherStatus.ISSUED
+            ).update(voucher_status=Voucher.VoucherStatus.EXPIRED, updated_at=timezone.now())
 
     @extend_schema_field(serializers.CharField)
     def get_redemption_info(self):
@@ -235,10 +492,31 @@ class Voucher(models.Model):
         super().save(*args, **kwargs)
 
     def generate_voucher_ref(self):
-        from django.utils.timezone import now
-        year_suffix = now().strftime('%y')
-        prefix = self.voucher_request.company.prefix.upper()
+        return Voucher.generate_voucher_refs(self.voucher_request.company, 1)[0]
+
+    @staticmethod
+    def generate_voucher_refs(company, count):
+        """
+        Reserve `count` consecutive refs ('PREFIX-YY-NNNN') for the given company
+        in a single counter update, so the cost does not depend on the table size.
+        """
+        year_suffix = timezone.now().strftime('%y')
+        prefix = company.prefix.upper()
+        first_seq = RefSequence.reserve(
+            RefSequence.SequenceKind.VOUCHER, prefix, year_suffix, count,
+            initial=lambda: Voucher.last_voucher_sequence(prefix, year_suffix)
+        )
+        return [
+            f"{prefix}-{year_suffix}-{str(seq).zfill(4)}"
+            for seq in range(first_seq, first_seq + count)
+        ]
 
+    @staticmethod
+    def last_voucher_sequence(prefix, year_suffix):
+        """
+        Highest sequence already used for 'PREFIX-YY'. Only used once per
+        (prefix, year) to seed the counter from refs created before it existed.
+        """
         base_code = f"{prefix}-{year_suffix}"
         similar_refs = Voucher.objects.filter(
             voucher_ref__startswith=base_code
@@ -254,12 +532,10 @@ class Voucher(models.Model):
                         max_seq = seq
             except:
                 continue
+        return max_seq
 
-        new_seq = str(max_seq + 1).zfill(4)
-        return f"{prefix}-{year_suffix}-{new_seq}"
 
-
-class Redemption(models.Model):
+class Redemption(ChangeTrackedModel):
     voucher = models.OneToOneField(
         Voucher, on_delete=models.CASCADE,
         related_name='redemption',
@@ -288,12 +564,23 @@ class AuditTrail(models.Model):
 
     class Meta:
         ordering = ['datetime']
+        indexes = [
+            # ordering of the lists, and the month ranges of the archival (see audit.py)
+            models.Index(fields=['datetime'], name='audit_datetime_idx'),
+            # history of one object, of one user (filters of AuditTrailsViewset), latest first
+            models.Index(fields=['table_name', 'object_id', 'datetime'], name='audit_object_datetime_idx'),
+            models.Index(fields=['user', 'datetime'], name='audit_user_datetime_idx'),
+        ]
+        # + the full-text index of the descriptions on PostgreSQL, see migration 0012
 
     datetime = models.DateTimeField(default=timezone.now)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='audit_trails')
+    # null for the entries written by scheduled jobs (management commands)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='audit_trails', null=True, blank=True)
     table_name = models.CharField(max_length=20, null=True, blank=True)
     object_id = models.IntegerField(null=True, blank=True)
     description = models.TextField(null=True, blank=True)
+    # updates: the changed fields only, {field: [old value, new value]}
+    changes = models.JSONField(null=True, blank=True)
     action = models.CharField(
         max_length=10,
         choices=AuditTrailsAction.choices,
@@ -301,4 +588,50 @@ class AuditTrail(models.Model):
     )
 
     def __str__(self):
-        return f"user: {self.user.username}, table_name: {self.table_name}, action: {self.action}"
+        username = self.user.username if self.user else "system"
+        return f"user: {username}, table_name: {self.table_name}, action: {self.action}"
+
+    @property
+    def rendered_description(self):
+        """ the description followed by one line per changed field (admin and API) """
+        lines = [self.description or ""]
+        for field, (old, new) in (self.changes or {}).items():
+            lines.append(f"{field}: {old!r} -> {new!r}")
+        return "\n".join(lines)
+
+
+class IdempotencyKey(models.Model):
+    """Response of a POST stored under the client's Idempotency-Key, replayed when the request is retried."""
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_key_expiry_idx'),
+        ]
+
+    key = models.CharField(max_length=255)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    request_fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+    # lease of the request still running (no response yet): once it is over, the worker is
+    # assumed dead and a retry may take the key over
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def purge_expired(cls, batch_size=5000):
+        """Delete the expired keys in chunks of `batch_size` rows; returns the number deleted."""
+        deleted = 0
+        while True:
+            expired_ids = list(
+                cls.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size]
+            )
+            if not expired_ids:
+                return deleted
+            deleted += cls.objects.filter(pk__in=expired_ids).delete()[0]
+
+    def __str__(self):
+        return f"user: {self.user_id}, key: {self.key}"
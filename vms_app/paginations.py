@@ -1,27 +1,107 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
-class VoucherRequestPagination(PageNumberPagination):
-    page_size = 10
+
+class SelectablePagination(PageNumberPagination):
+    """
+    Page number pagination (the default contract: count, next, previous, results)
+    with a keyset mode that skips the COUNT(*) and the OFFSET scans of deep pages.
+
+    The cursor mode is selected with `?pagination=cursor` (following the `next`/`previous`
+    links keeps it), or for a whole endpoint with `pagination_mode = 'cursor'` on the view.
+    Cursor pages are ordered by `cursor_ordering`, which must be unique and index-backed.
+    """
+    PAGE = 'page'
+    CURSOR = 'cursor'
+
+    page_size_query_param = 'page_size'
     max_page_size = 100
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('id',)
+
+    def get_pagination_mode(self, request, view):
+        if request.query_params.get(self.cursor_query_param):
+            return self.CURSOR
+        mode = request.query_params.get(self.mode_query_param) or getattr(view, 'pagination_mode', self.PAGE)
+        return self.CURSOR if mode == self.CURSOR else self.PAGE
+
+    def get_cursor_paginator(self):
+        paginator = CursorPagination()
+        paginator.ordering = self.cursor_ordering
+        paginator.cursor_query_param = self.cursor_query_param
+        paginator.page_size = self.page_size
+        paginator.page_size_query_param = self.page_size_query_param
+        paginator.max_page_size = self.max_page_size
+        return paginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.get_pagination_mode(request, view) == self.CURSOR:
+            self.cursor_paginator = self.get_cursor_paginator()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_html_context()
+        return super().get_html_context()
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        return parameters + [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': "'cursor' for keyset pagination (next/previous links, no count)",
+                'schema': {'type': 'string', 'enum': [self.PAGE, self.CURSOR]},
+            },
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value (cursor mode).',
+                'schema': {'type': 'string'},
+            },
+        ]
+
+
+class AuditTrailPagination(SelectablePagination):
+    page_size = 20
+    # backed by the datetime indexes (alone, and after the object or user filters)
+    cursor_ordering = ('-datetime', '-id')
 
-class VoucherPagination(PageNumberPagination):
+
+class VoucherRequestPagination(SelectablePagination):
     page_size = 10
-    max_page_size = 100
+    cursor_ordering = ('-id',)
+
 
+class ClientVoucherRequestsPagination(VoucherRequestPagination):
+    # backed by the (client, -date_time_recorded, -id) index
+    cursor_ordering = ('-date_time_recorded', '-id')
 
-class ClientsPagination(PageNumberPagination):
+
+class VoucherPagination(SelectablePagination):
     page_size = 10
-    max_page_size = 100
 
 
-class UserPagination(PageNumberPagination):
+class ClientsPagination(SelectablePagination):
+    page_size = 10
+
+
+class UserPagination(SelectablePagination):
     page_size = 15
-    max_page_size = 100
 
-class CompanyPagination(PageNumberPagination):
+
+class CompanyPagination(SelectablePagination):
     page_size = 10
-    max_page_size = 100
 
-class ShopPagination(PageNumberPagination):
+
+class ShopPagination(SelectablePagination):
     page_size = 15
-    max_page_size = 100
\ No newline at end of file
@@ -0,0 +1,61 @@
+import msgpack
+import orjson
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+# the types orjson and msgpack do not encode (or not like DRF: datetimes, decimals...)
+# go through DRF's own encoder, so every format carries the same values
+encode_default = JSONEncoder().default
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """
+    Same output as DRF's JSONRenderer (compact, utf-8, 'Z' for UTC datetimes),
+    encoded by orjson: several times faster on big voucher and audit pages.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            # pretty printed for the browsable API: speed does not matter there
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=encode_default, option=self.options)
+        # like JSONRenderer: valid JSON, but not valid javascript unescaped
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """ compact binary format (Accept: application/msgpack), same values as the JSON """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+class ExportRenderer(renderers.BaseRenderer):
+    """
+    Lets the export endpoints accept their own format (Accept: text/csv, application/x-ndjson,
+    or ?format=). Nothing is rendered here: the view streams the rows itself (exports.py).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
@@ -1,13 +1,17 @@
 import base64
+from datetime import timedelta
 from typing import Optional, Dict, Any
 from urllib.parse import urljoin
 from django.conf import settings
 from django.core.files.uploadedfile import UploadedFile
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
 
 from drf_spectacular.utils import extend_schema_field
 
 from .utils import logs_audit_action, validate_and_format_date
+from .fieldsets import SparseFieldsetMixin
 from django.contrib.auth.models import Group, Permission
 from rest_framework import serializers
 from rest_framework.permissions import SAFE_METHODS
@@ -16,7 +20,22 @@ from vms_app.models import (
     Company, Shop, Redemption, AuditTrail
 )
 
-class UserSerializer(serializers.ModelSerializer):
+# tolerance for tills whose clock runs slightly ahead of the server
+OFFLINE_REDEMPTION_CLOCK_SKEW = timedelta(minutes=5)
+
+# number of voucher requests embedded in the client detail
+CLIENT_LATEST_VOUCHER_REQUESTS = 10
+
+
+def asset_url(url_name, obj, digest):
+    """ absolute url of a binary asset (logo, signature), addressed by its content hash """
+    if not digest:
+        return None
+    base_url = getattr(settings, "BASE_URL", "http://localhost:8000")
+    return urljoin(base_url, reverse(f"vms_app:{url_name}", kwargs={"pk": obj.pk, "digest": digest}))
+
+
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Create, update, delete, and view users."""
     password = serializers.CharField(write_only=True, required=False)
     username = serializers.CharField(required=False)
@@ -28,15 +47,22 @@ class UserSerializer(serializers.ModelSerializer):
     user_permissions = serializers.PrimaryKeyRelatedField(
         queryset=Permission.objects.all(), many=True, required=False, write_only=True
     )
+    signature_url = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = [
             "id", "last_login", "first_name", "last_name", "username", "email",
             "password", "is_staff", "is_active", "is_superuser", "company",
-            "permissions", "user_groups", "groups", "user_permissions"
+            "permissions", "user_groups", "groups", "user_permissions", "signature_url"
         ]
         read_only_fields = ['date_joined', 'id', 'last_login']
+        field_sources = {
+            "permissions": ["user_permissions"], "user_groups": ["groups"], "signature_url": ["signature_hash"]
+        }
+
+    def get_signature_url(self, obj) -> Optional[str]:
+        return asset_url("user_signature", obj, obj.signature_hash)
 
     def get_permissions(self, obj):
         return [permission.codename for permission in obj.user_permissions.all()]
@@ -49,7 +75,7 @@ class UserSerializer(serializers.ModelSerializer):
         # Exclude password field if the request method is SAFE (GET, HEAD, OPTIONS)
         request = self.context.get('request')
         if request and request.method in SAFE_METHODS:
-            self.fields.pop('password')
+            self.fields.pop('password', None)
 
     def validate(self, data):
         """Validate that username and emails are unique."""
@@ -109,7 +135,7 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class CurrentUserSerializer(serializers.ModelSerializer):
+class CurrentUserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for retrieving the current user's basic details."""
 
     class Meta:
@@ -125,7 +151,7 @@ shop_supervisor_permissions = [
     'view_redemption'
 ]
 
-class RegisterUserSerializer(serializers.ModelSerializer):
+class RegisterUserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Create an account for a supervisor."""
 
     password = serializers.CharField(write_only=True)
@@ -179,13 +205,27 @@ class RegisterUserSerializer(serializers.ModelSerializer):
         return user
 
 
-class CompanySerializer(serializers.ModelSerializer):
+class CompanySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     prefix = serializers.CharField(required=False)
     logo = serializers.SerializerMethodField()
+    logo_hash = serializers.CharField(source='company_logo_hash', read_only=True)
+    logo_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Company
-        fields = ['id', 'company_name', 'prefix', 'logo']
+        fields = ['id', 'company_name', 'prefix', 'logo', 'logo_hash', 'logo_url']
+        field_sources = {'logo': ['company_logo'], 'logo_url': ['company_logo_hash']}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # lists and nested companies (shops) only carry the logo hash and url:
+        # the image itself is fetched (and cached) from the logo url
+        if self.parent is not None:
+            fields.pop('logo', None)
+        return fields
+
+    def get_logo_url(self, obj) -> Optional[str]:
+        return asset_url("company_logo", obj, obj.company_logo_hash)
 
     def get_logo(self, obj):
         try:
@@ -221,7 +261,7 @@ class CompanySerializer(serializers.ModelSerializer):
 
 
 
-class ShopSerializer(serializers.ModelSerializer):
+class ShopSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     company = CompanySerializer(read_only=True)
     company_id = serializers.PrimaryKeyRelatedField(
         queryset=Company.objects.all(),
@@ -234,7 +274,7 @@ class ShopSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'company']
 
 
-class RedemptionSerializer(serializers.ModelSerializer):
+class RedemptionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     redeemed_on = serializers.DateTimeField(source='redemption_date', read_only=True)  # Fetch redemption_date
     redeemed_by = serializers.CharField(source='user.username', read_only=True)  # Fetch user's username
     redeemed_at = serializers.SerializerMethodField()  # Correct usage of SerializerMethodField
@@ -242,6 +282,7 @@ class RedemptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Redemption
         fields = ["id", "redeemed_on", "till_no", "redeemed_by", "redeemed_at", "voucher"]
+        field_sources = {"redeemed_at": ["shop__company"]}
 
     @extend_schema_field(str)
     def get_redeemed_at(self, obj):
@@ -249,7 +290,7 @@ class RedemptionSerializer(serializers.ModelSerializer):
         return f"{obj.shop.company.company_name} {obj.shop.location}"
 
 
-class VoucherSerializer(serializers.ModelSerializer):
+class VoucherSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     redemption = serializers.SerializerMethodField()
     class Meta:
         model = Voucher
@@ -264,6 +305,7 @@ class VoucherSerializer(serializers.ModelSerializer):
             "redemption"
         ]
         read_only_fields = ["id"]
+        field_sources = {"redemption": ["redemption"]}
 
     def create(self, validated_data):
         if 'expiry_date' in validated_data:
@@ -283,19 +325,79 @@ class VoucherSerializer(serializers.ModelSerializer):
         try:
             redemption = obj.redemption
             if redemption:
-                return RedemptionSerializer(redemption).data
+                return RedemptionSerializer(
+                    redemption, field_selection=self.field_selection.nested('redemption')
+                ).data
         except Redemption.DoesNotExist:
             return None
 
 
-class VoucherRequestListSerializer(serializers.ModelSerializer):
+class BatchRedemptionSerializer(serializers.Serializer):
+    """Input of the batch redemption endpoint: several vouchers redeemed in one basket."""
+    class RedemptionMode:
+        ALL_OR_NOTHING = 'all_or_nothing'
+        PARTIAL = 'partial'
+
+    MAX_VOUCHERS = 100
+
+    vouchers = serializers.ListField(
+        child=serializers.JSONField(), allow_empty=False, max_length=MAX_VOUCHERS,
+        help_text="Voucher ids (integers) and/or voucher refs (strings)"
+    )
+    shop_id = serializers.IntegerField()
+    till_no = serializers.IntegerField(required=False, allow_null=True)
+    mode = serializers.ChoiceField(
+        choices=[RedemptionMode.ALL_OR_NOTHING, RedemptionMode.PARTIAL],
+        default=RedemptionMode.ALL_OR_NOTHING,
+        help_text="'all_or_nothing' redeems nothing if one voucher fails, "
+                  "'partial' redeems every voucher that can be redeemed"
+    )
+
+    def validate_vouchers(self, value):
+        for item in value:
+            if isinstance(item, bool) or not isinstance(item, (int, str)):
+                raise serializers.ValidationError(
+                    "Each voucher must be an id (integer) or a voucher_ref (string)."
+                )
+        return value
+
+
+class OfflineRedemptionSerializer(serializers.Serializer):
+    """A redemption recorded by a till while it was offline."""
+    local_id = serializers.CharField(
+        required=False, allow_blank=True, max_length=100,
+        help_text="Id of the redemption in the till's queue, returned with its result"
+    )
+    voucher_ref = serializers.CharField(max_length=50)
+    shop_id = serializers.IntegerField()
+    till_no = serializers.IntegerField(required=False, allow_null=True)
+    user_id = serializers.IntegerField(
+        required=False,
+        help_text="User of the same company who redeemed the voucher (defaults to the authenticated user)"
+    )
+    redeemed_at = serializers.DateTimeField(help_text="Till's local date and time of the redemption")
+
+    def validate_redeemed_at(self, value):
+        if value > timezone.now() + OFFLINE_REDEMPTION_CLOCK_SKEW:
+            raise serializers.ValidationError("Redemption date cannot be in the future.")
+        return value
+
+
+class OfflineRedemptionSyncSerializer(serializers.Serializer):
+    """Input of the offline redemptions sync endpoint."""
+    MAX_REDEMPTIONS = 1000
+
+    redemptions = OfflineRedemptionSerializer(many=True, allow_empty=False, max_length=MAX_REDEMPTIONS)
+
+
+class VoucherRequestListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = VoucherRequest
         fields = "__all__"
         read_only_fields = ['date_time_recorded', 'request_ref', 'id']
 
 
-class VoucherRequestCrudSerializer(serializers.ModelSerializer):
+class VoucherRequestCrudSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     request_doc_pdf = serializers.FileField(required=False)
     request_doc_pdf_url = serializers.SerializerMethodField()
     pop_doc_pdf = serializers.FileField(required=False, allow_null=True)
@@ -313,6 +415,7 @@ class VoucherRequestCrudSerializer(serializers.ModelSerializer):
             "pop_doc_pdf", "payment_remarks", "date_time_paid",
         ]
         read_only_fields = ['date_time_recorded', 'request_ref', 'id']
+        field_sources = {"request_doc_pdf_url": ["request_doc_pdf"]}
 
     def get_request_doc_pdf_url(self, obj):
         if obj.request_doc_pdf and hasattr(obj.request_doc_pdf, 'url'):
@@ -324,21 +427,33 @@ class VoucherRequestCrudSerializer(serializers.ModelSerializer):
         try:
             # Ensure the instance is updated with the correct database values after creation
             validated_data["request_status"] = "pending"
-            instance = super().create(validated_data)
-            # Create provisional vouchers
-            quantity = validated_data.get('quantity_of_vouchers', 0)
-            for i in range(quantity):
-                Voucher.objects.create(
-                    voucher_request=instance,
-                    voucher_status=Voucher.VoucherStatus.PROVISIONAL,
-                    amount=instance.amount
-                )
+            instance = VoucherRequest(**validated_data)
+            # reserved (and committed) before the transaction below: the ref counters are locked
+            # for the reservations only, not during the voucher inserts
+            voucher_refs = instance.reserve_refs()
+            with transaction.atomic():
+                instance.save(force_insert=True)
+                # Create provisional vouchers
+                vouchers = instance.create_provisional_vouchers(voucher_refs)
+                if vouchers:
+                    self.log_vouchers_issuance(instance, vouchers)
 
             instance.refresh_from_db()
             return instance
         except IntegrityError as e:
             raise serializers.ValidationError({"detail": f"Database integrity error: {str(e)}"})
 
+    def log_vouchers_issuance(self, instance, vouchers):
+        """Write a single audit entry for the whole batch of provisional vouchers."""
+        request = self.context.get('request')
+        user = request.user if request else instance.recorded_by
+        if not user or not user.is_authenticated:
+            return
+        description = (
+            f"Created {len(vouchers)} provisional vouchers for voucher request {instance.request_ref}: "
+            f"{vouchers[0].voucher_ref} to {vouchers[-1].voucher_ref}"
+        )
+        logs_audit_action(instance, AuditTrail.AuditTrailsAction.ADD, description, user)
 
     def update(self, instance, validated_data):
         # 🛡️ Defensive check to prevent saving a memoryview
@@ -348,20 +463,22 @@ class VoucherRequestCrudSerializer(serializers.ModelSerializer):
 
         return super().update(instance, validated_data)
 
-class ClientListSerializer(serializers.ModelSerializer):
-    """serializer for client list"""
+class ClientListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """serializer for client list (the logo is fetched from logo_url)"""
+    logo_url = serializers.SerializerMethodField()
+
     class Meta:
         model = Client
-        fields = ['id', 'clientname', 'email', 'contact', 'brn', 'vat', 'nic', 'iscompany', 'logo']
-        read_only_fields = ['id']
+        fields = ['id', 'clientname', 'email', 'contact', 'brn', 'vat', 'nic', 'iscompany', 'logo_hash', 'logo_url']
+        read_only_fields = ['id', 'logo_hash']
+        field_sources = {'logo_url': ['logo_hash']}
 
-    def get_logo(self, obj):
-        if obj.logo:
-            return base64.b64encode(obj.logo).decode('utf-8')
-        return ""
+    def get_logo_url(self, obj) -> Optional[str]:
+        return asset_url("client_logo", obj, obj.logo_hash)
 
-class ClientCrudSerializer(serializers.ModelSerializer):
-    client_voucher_requests = VoucherRequestListSerializer(many=True, read_only=True)
+class ClientCrudSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    # only the latest requests: the full history is paginated at /vms/api/clients/<pk>/voucher_requests/
+    client_voucher_requests = serializers.SerializerMethodField()
 
     class Meta:
         model = Client
@@ -370,6 +487,18 @@ class ClientCrudSerializer(serializers.ModelSerializer):
             "email", "contact", "logo", "client_voucher_requests"
         ]
         read_only_fields = ['id']
+        # loaded by a query of their own
+        field_sources = {"client_voucher_requests": []}
+
+    @extend_schema_field(VoucherRequestListSerializer(many=True))
+    def get_client_voucher_requests(self, obj):
+        latest_requests = obj.client_voucher_requests.order_by(
+            '-date_time_recorded', '-id'
+        )[:CLIENT_LATEST_VOUCHER_REQUESTS]
+        return VoucherRequestListSerializer(
+            latest_requests, many=True, context=self.context,
+            field_selection=self.field_selection.nested('client_voucher_requests')
+        ).data
 
     def create(self, validated_data):
         logo_b64 = self.initial_data.get('logo')
@@ -392,14 +521,14 @@ class ClientCrudSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class PermissionsListSerializer(serializers.ModelSerializer):
+class PermissionsListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Permission
         fields = ["id", "name", "codename"]
         read_only_fields = ['id']
 
 
-class GroupCustomSerializer(serializers.ModelSerializer):
+class GroupCustomSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for the list of groups with hyperlinking"""
     permissions = PermissionsListSerializer(many=True)
 
@@ -413,12 +542,14 @@ class GroupCustomSerializer(serializers.ModelSerializer):
         return [permission.codename for permission in obj.user_permissions.all()]
 
 
-class AuditTrailsSerializer(serializers.ModelSerializer):
-    executed_by = serializers.CharField(source='user.username', read_only=True)
+class AuditTrailsSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    executed_by = serializers.CharField(source='user.username', read_only=True, allow_null=True)
+    description = serializers.CharField(source='rendered_description', read_only=True)
     class Meta:
         model = AuditTrail
-        fields = ["id", "datetime", "action", "table_name", "object_id", "description", "executed_by"]
-        read_only_fields = ["id", "datetime", "action", "table_name", "object_id", "description", "user"]
+        fields = ["id", "datetime", "action", "table_name", "object_id", "description", "changes", "executed_by"]
+        read_only_fields = ["id", "datetime", "action", "table_name", "object_id", "changes", "user"]
+        field_sources = {"description": ["description", "changes"]}
 
 """
 4) @Todo: call logs_action_action in every serializer after insert, update and delete
@@ -1,8 +1,15 @@
-from django.db.models.signals import post_save, pre_save
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save, m2m_changed, pre_delete, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 
-from vms_app.models import VoucherRequest, Voucher
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from vms_app.authentication import cache_blacklisted, uncache_blacklisted
+from vms_app.backends import invalidate_cached_permissions
+from vms_app.caching import invalidate_catalog
+from vms_app.models import VoucherRequest, Voucher, User, Company, Shop
 from datetime import date, timedelta
 
 from vms_app.utils import notify_requests_approvers
@@ -33,12 +40,112 @@ def update_voucher_expiry_and_status_after_request_approval(instance, **kwargs):
         # Si le statut passe de 'paid' à 'approved', on met à jour les vouchers
         if old_status == 'paid' and new_status == 'approved':
             queryset = Voucher.objects.filter(voucher_request=instance)
-            queryset.update(expiry_date=vouchers_expiry_date, voucher_status="issued")
+            queryset.update(expiry_date=vouchers_expiry_date, voucher_status="issued", updated_at=timezone.now())
             instance.date_time_approved = timezone.now()
         if old_status != 'rejected' and new_status == 'rejected':
             queryset = Voucher.objects.filter(voucher_request=instance)
-            queryset.update(voucher_status="cancelled")
+            queryset.update(voucher_status="cancelled", updated_at=timezone.now())
 
         """if old_status == 'pending' and new_status == 'paid':
                 # Notify all users with approval rights when a voucher request status changes from 'pending' to 'paid'
-            notify_requests_approvers(instance.request_ref)"""
\ No newline at end of file
+            notify_requests_approvers(instance.request_ref)"""
+
+
+def users_of_groups(group_ids):
+    return User.objects.filter(groups__id__in=group_ids).values_list('id', flat=True)
+
+
+def changed_users(instance, action, reverse, pk_set):
+    """ ids of the users whose groups or user_permissions change (None: the action changes nothing) """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return None
+    if not reverse:
+        return [instance.pk]
+    if action == 'pre_clear':
+        # group.user_set.clear() / permission.user_set.clear(): the users are still linked
+        return list(instance.user_set.values_list('id', flat=True))
+    return pk_set
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_permissions_after_user_change(instance, action, reverse, pk_set, **kwargs):
+    """ the cached permissions of a user change with their groups and user_permissions """
+    user_ids = changed_users(instance, action, reverse, pk_set)
+    if user_ids is not None:
+        invalidate_cached_permissions(user_ids)
+    if user_ids:
+        # the user payload lists them: it changes too (conditional GETs)
+        User.objects.filter(pk__in=user_ids).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_permissions_after_group_change(instance, action, reverse, pk_set, **kwargs):
+    """ changing the permissions of a group changes the permissions of all its users """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_cached_permissions(users_of_groups([instance.pk]))
+    elif action == 'pre_clear':
+        invalidate_cached_permissions(users_of_groups(instance.group_set.values_list('id', flat=True)))
+    else:
+        invalidate_cached_permissions(users_of_groups(pk_set))
+
+
+@receiver(post_save, sender=User)
+def invalidate_permissions_after_user_save(instance, created, update_fields, **kwargs):
+    """
+    never reuse a permission set cached for a previous user with the same id, and revoke
+    the token claims (authentication.py) when the user changes (is_active, is_staff, company...)
+    """
+    if not created and update_fields and set(update_fields) <= {'last_login', 'updated_at'}:
+        # a login: nothing the claims or permissions depend on
+        return
+    invalidate_cached_permissions([instance.pk])
+
+
+@receiver(pre_delete, sender=User)
+def invalidate_permissions_before_user_delete(instance, **kwargs):
+    invalidate_cached_permissions([instance.pk])
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_permissions_before_group_delete(instance, **kwargs):
+    invalidate_cached_permissions(users_of_groups([instance.pk]))
+
+
+@receiver(pre_delete, sender=Permission)
+def invalidate_permissions_before_permission_delete(instance, **kwargs):
+    invalidate_cached_permissions(
+        set(instance.user_set.values_list('id', flat=True))
+        | set(users_of_groups(instance.group_set.values_list('id', flat=True)))
+    )
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def invalidate_catalog_after_change(**kwargs):
+    """
+    the cached company and shop lists (caching.py) are stale, once the change is committed:
+    a list read in between would otherwise be cached under the new version with the old rows
+    """
+    transaction.on_commit(invalidate_catalog)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def cache_blacklisted_token(instance, created, **kwargs):
+    """ a token rotated or blacklisted from the admin is rejected at once, without a query (authentication.py) """
+    if created:
+        cache_blacklisted(instance.token.jti, instance.token.expires_at)
+
+
+@receiver(post_delete, sender=BlacklistedToken)
+def uncache_deleted_blacklisted_token(instance, origin=None, **kwargs):
+    """
+    a token taken off the blacklist (from the admin) is accepted again. Entries deleted with
+    their outstanding token (prune_tokens) are left to expire: that token is gone anyway.
+    """
+    if isinstance(origin, BlacklistedToken) or getattr(origin, 'model', None) is BlacklistedToken:
+        uncache_blacklisted(instance.token.jti)
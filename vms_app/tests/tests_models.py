@@ -1,5 +1,13 @@
-from django.test import Client, TestCase
+import tempfile
+from datetime import datetime, time, timedelta
+from io import StringIO
 
+from django.core.management import call_command
+from django.db import transaction
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+
+from vms_app.audit import audit_writer, archive_path, read_archive, add_months
 from vms_app.models import (
     User,
     Client,
@@ -7,6 +15,8 @@ from vms_app.models import (
     Voucher,
     #Redemption,
     Company,
+    RefSequence,
+    AuditTrail,
     #Shop
 )
 
@@ -63,6 +73,207 @@ class VoucherRequestTestCase(TestCase):
             "default status should be provisional."
         )
 
+class VoucherRefTestCase(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(company_name="ref_company", prefix="RFC")
+        self.voucher_request = VoucherRequest.objects.create(
+            company=self.company,
+            quantity_of_vouchers=3,
+        )
+        self.year_suffix = timezone.now().strftime('%y')
+
+    def test_voucher_refs_are_sequential(self):
+        first = Voucher.objects.create(voucher_request=self.voucher_request, amount=100)
+        second = Voucher.objects.create(voucher_request=self.voucher_request, amount=100)
+        self.assertEqual(first.voucher_ref, f"RFC-{self.year_suffix}-0001")
+        self.assertEqual(second.voucher_ref, f"RFC-{self.year_suffix}-0002")
+
+    def test_counter_continues_from_existing_refs(self):
+        Voucher.objects.create(
+            voucher_request=self.voucher_request,
+            voucher_ref=f"RFC-{self.year_suffix}-0041",
+            amount=100,
+        )
+        voucher = Voucher.objects.create(voucher_request=self.voucher_request, amount=100)
+        self.assertEqual(voucher.voucher_ref, f"RFC-{self.year_suffix}-0042")
+
+    def test_reserve_block_of_refs(self):
+        refs = Voucher.generate_voucher_refs(self.company, 3)
+        next_ref = Voucher.generate_voucher_refs(self.company, 1)
+        self.assertEqual(refs, [f"RFC-{self.year_suffix}-000{i}" for i in (1, 2, 3)])
+        self.assertEqual(next_ref, [f"RFC-{self.year_suffix}-0004"])
+        self.assertEqual(
+            RefSequence.objects.get(kind=RefSequence.SequenceKind.VOUCHER, prefix="RFC").last_value, 4
+        )
+
+    def test_reserve_rejects_empty_blocks(self):
+        Voucher.generate_voucher_refs(self.company, 2)
+        for count in (0, -2):
+            with self.assertRaises(ValueError):
+                Voucher.generate_voucher_refs(self.company, count)
+        self.assertEqual(
+            RefSequence.objects.get(kind=RefSequence.SequenceKind.VOUCHER, prefix="RFC").last_value, 2
+        )
+
+
+class RequestRefTestCase(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(company_name="ref_company", prefix="RFC")
+        self.other_company = Company.objects.create(company_name="other_company", prefix="OTC")
+        self.year_suffix = timezone.now().strftime('%y')
+
+    def test_request_refs_share_a_yearly_sequence(self):
+        first = VoucherRequest.objects.create(company=self.company)
+        second = VoucherRequest.objects.create(company=self.other_company)
+        self.assertEqual(first.request_ref, f"VRQ-RFC-{self.year_suffix}-#1")
+        self.assertEqual(second.request_ref, f"VRQ-OTC-{self.year_suffix}-#2")
+
+    def test_counter_compares_existing_refs_numerically(self):
+        for sequence in (9, 10):
+            VoucherRequest.objects.create(request_ref=f"VRQ-RFC-{self.year_suffix}-#{sequence}")
+        voucher_request = VoucherRequest.objects.create(company=self.company)
+        self.assertEqual(voucher_request.request_ref, f"VRQ-RFC-{self.year_suffix}-#11")
+
+
+class VoucherExpiryTestCase(TestCase):
+    def setUp(self):
+        company = Company.objects.create(company_name="expiry_company", prefix="EXC")
+        voucher_request = VoucherRequest.objects.create(company=company, quantity_of_vouchers=4)
+        today = timezone.localdate()
+        self.overdue = Voucher.objects.create(
+            voucher_request=voucher_request, voucher_status="issued", expiry_date=today - timedelta(days=1)
+        )
+        self.extended = Voucher.objects.create(
+            voucher_request=voucher_request, voucher_status="issued",
+            expiry_date=today - timedelta(days=1), extention_date=today + timedelta(days=30)
+        )
+        self.extension_over = Voucher.objects.create(
+            voucher_request=voucher_request, voucher_status="issued",
+            expiry_date=today - timedelta(days=60), extention_date=today - timedelta(days=2)
+        )
+        self.valid = Voucher.objects.create(
+            voucher_request=voucher_request, voucher_status="issued", expiry_date=today
+        )
+
+    def test_expire_vouchers_command(self):
+        call_command("expire_vouchers", "--batch-size", "1", stdout=StringIO())
+        statuses = {
+            voucher.pk: voucher.voucher_status
+            for voucher in Voucher.objects.filter(voucher_ref__startswith="EXC-")
+        }
+        self.assertEqual(statuses[self.overdue.pk], "expired")
+        self.assertEqual(statuses[self.extension_over.pk], "expired")
+        self.assertEqual(statuses[self.extended.pk], "issued", "the extention_date must be honoured")
+        self.assertEqual(statuses[self.valid.pk], "issued")
+
+        audit = AuditTrail.objects.get(table_name="Voucher")
+        self.assertIsNone(audit.user)
+        self.assertIn("Expired 2 issued vouchers", audit.description)
+
+        # nothing left to expire: no new audit entry
+        call_command("expire_vouchers", stdout=StringIO())
+        self.assertEqual(AuditTrail.objects.filter(table_name="Voucher").count(), 1)
+
+
+# no background flusher: the test decides when the queue is written
+@override_settings(AUDIT_TRAIL_BUFFERED=True, AUDIT_FLUSH_INTERVAL=0, AUDIT_FLUSH_BATCH_SIZE=3)
+class AuditTrailWriterTestCase(TestCase):
+    def setUp(self):
+        audit_writer.flush()
+        self.company = Company.objects.create(company_name="Audit Company", prefix="AUD")
+
+    def entry(self, description):
+        return AuditTrail(
+            table_name="Company", object_id=self.company.pk, description=description,
+            action=AuditTrail.AuditTrailsAction.UPDATE,
+        )
+
+    def test_entries_written_on_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            audit_writer.log([self.entry("first"), self.entry("second")])
+            self.assertEqual(AuditTrail.objects.count(), 0, "nothing is queued before the commit")
+        self.assertEqual(AuditTrail.objects.count(), 0, "queued, not written yet")
+        self.assertEqual(audit_writer.flush(), 2)
+        self.assertEqual(AuditTrail.objects.count(), 2)
+        self.assertEqual(audit_writer.flush(), 0)
+
+    def test_full_batch_is_written(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            audit_writer.log([self.entry(f"entry {index}") for index in range(3)])
+        self.assertEqual(AuditTrail.objects.count(), 3)
+
+    def test_rejected_row_does_not_block_the_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            broken = self.entry("broken")
+            broken.datetime = None
+            audit_writer.log([self.entry("before"), broken])
+        with self.assertLogs('vms_app.audit', level='ERROR'):
+            self.assertEqual(audit_writer.flush(), 1)
+        self.assertEqual(list(AuditTrail.objects.values_list("description", flat=True)), ["before"])
+        self.assertEqual(audit_writer.flush(), 0, "the rejected row is not queued again")
+
+    def test_shutdown_writes_the_queue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            audit_writer.log([self.entry("last")])
+        audit_writer.shutdown()
+        self.addCleanup(setattr, audit_writer, '_stopping', False)
+        self.assertEqual(AuditTrail.objects.count(), 1)
+
+    def test_rolled_back_entries_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    audit_writer.log([self.entry("rolled back")])
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(len(callbacks), 0)
+        self.assertEqual(audit_writer.flush(), 0)
+        self.assertEqual(AuditTrail.objects.count(), 0)
+
+
+class AuditTrailArchiveTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.user = User.objects.create_user(username="auditor", password="password")
+        now = timezone.now()
+        self.old_month = add_months(timezone.localdate(), -14)
+        old = timezone.make_aware(datetime.combine(self.old_month.replace(day=10), time.min))
+        self.old_entries = [
+            AuditTrail.objects.create(
+                user=self.user, table_name="Voucher", object_id=index, action="update",
+                description=f"old {index}", changes={"amount": ["100.00", "200.00"]}, datetime=old,
+            )
+            for index in range(3)
+        ]
+        self.recent = AuditTrail.objects.create(table_name="Voucher", object_id=9, action="add", datetime=now)
+
+    def archive(self):
+        call_command("archive_audit_trail", "--keep-months", "12", "--directory", self.directory.name,
+                     "--batch-size", "2", stdout=StringIO())
+
+    def test_archive_and_restore(self):
+        self.archive()
+        self.assertEqual(list(AuditTrail.objects.values_list("pk", flat=True)), [self.recent.pk])
+        rows = list(read_archive(archive_path(self.old_month, self.directory.name)))
+        self.assertEqual([row["id"] for row in rows], [entry.pk for entry in self.old_entries])
+        self.assertEqual(rows[0]["changes"], {"amount": ["100.00", "200.00"]})
+
+        call_command("restore_audit_trail", f"{self.old_month:%Y-%m}", "--directory", self.directory.name,
+                     stdout=StringIO())
+        restored = AuditTrail.objects.get(pk=self.old_entries[0].pk)
+        self.assertEqual(restored.datetime, self.old_entries[0].datetime)
+        self.assertEqual(restored.user, self.user)
+        self.assertEqual(restored.description, "old 0")
+
+        # archived again: merged with the existing file, no duplicate
+        self.archive()
+        rows = list(read_archive(archive_path(self.old_month, self.directory.name)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(AuditTrail.objects.count(), 1)
+
+
 """class RedemptionTestCase(TestCase):
     def setUp(self):
         pass"""
\ No newline at end of file
@@ -0,0 +1,71 @@
+import hashlib
+
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+from vms_app.models import User, Client, Company
+
+PNG_LOGO = b'\x89PNG\r\n\x1a\n' + b'logo' * 50
+
+
+class BinaryAssetsTestCase(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(company_name="company1", prefix="CP1", company_logo=PNG_LOGO)
+        self.customer = Client.objects.create(
+            clientname="client1", email="client1@gmail.com", contact="+230 5429 7857", logo=PNG_LOGO
+        )
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.digest = hashlib.sha256(PNG_LOGO).hexdigest()
+        self.client = APIClient()
+
+    def test_content_hash_follows_the_binary_field(self):
+        self.assertEqual(self.company.company_logo_hash, self.digest)
+        self.company.company_logo = b'other logo'
+        self.company.save(update_fields=['company_logo'])
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.company_logo_hash, hashlib.sha256(b'other logo').hexdigest())
+        # saving a company loaded without its logo keeps the hash
+        company = Company.objects.defer('company_logo').get(pk=self.company.pk)
+        company.company_name = "renamed"
+        company.save()
+        company.refresh_from_db()
+        self.assertEqual(company.company_logo_hash, hashlib.sha256(b'other logo').hexdigest())
+
+    def test_company_list_only_carries_logo_hash_and_url(self):
+        response = self.client.get("/vms/api/all_companies/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        company = response.data[0]
+        self.assertNotIn('logo', company)
+        self.assertEqual(company['logo_hash'], self.digest)
+        self.assertTrue(
+            company['logo_url'].endswith(f"/vms/api/assets/company_logos/{self.company.pk}/{self.digest}/")
+        )
+
+    def test_company_logo_is_served_with_an_etag(self):
+        url = f"/vms/api/assets/company_logos/{self.company.pk}/{self.digest}/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, PNG_LOGO)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['ETag'], f'"{self.digest}"')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        # revalidation is answered from the hash alone
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"{self.digest}"')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_outdated_digest_is_not_found(self):
+        response = self.client.get(f"/vms/api/assets/company_logos/{self.company.pk}/{'0' * 64}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_client_logo_requires_authentication(self):
+        url = f"/vms/api/assets/client_logos/{self.customer.pk}/{self.digest}/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, PNG_LOGO)
+        self.assertIn('private', response['Cache-Control'])
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import Permission
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from vms_app.models import User, AuditTrail
+
+
+class AuditTrailViewsTestCase(TestCase):
+    def setUp(self):
+        self.url = "/vms/api/audit-trails/"
+        self.admin = User.objects.create_user(username='auditor', password='password', is_staff=True)
+        self.admin.user_permissions.add(Permission.objects.get(codename='view_audittrail'))
+        self.cashier = User.objects.create_user(username='cashier', password='password')
+        now = timezone.now()
+        for index in range(25):
+            AuditTrail.objects.create(
+                user=self.cashier if index % 5 == 0 else self.admin,
+                table_name="VoucherRequest" if index < 10 else "Voucher",
+                object_id=123 if index < 10 else index,
+                action="update" if index % 2 else "add",
+                description=f"Updated voucher request RQ-{index:03d}",
+                datetime=now - timedelta(days=index),
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def results(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_list_is_paginated_latest_first(self):
+        data = self.results()
+        self.assertNotIn("count", data, "cursor pages by default")
+        self.assertEqual(len(data["results"]), 20)
+        self.assertIsNotNone(data["next"])
+        datetimes = [entry["datetime"] for entry in data["results"]]
+        self.assertEqual(datetimes, sorted(datetimes, reverse=True))
+
+        next_page = self.client.get(data["next"]).json()
+        self.assertEqual(len(next_page["results"]), 5)
+
+        self.assertEqual(self.results(pagination="page")["count"], 25)
+
+    def test_object_history(self):
+        data = self.results(table_name="VoucherRequest", object_id=123, action="add")
+        self.assertEqual(len(data["results"]), 5)
+        self.assertEqual({entry["object_id"] for entry in data["results"]}, {123})
+        self.assertEqual({entry["action"] for entry in data["results"]}, {"add"})
+
+    def test_user_and_datetime_filters(self):
+        since = (timezone.now() - timedelta(days=12, hours=1)).isoformat()
+        data = self.results(user=self.cashier.id, datetime__gte=since)
+        self.assertEqual(len(data["results"]), 3)
+        self.assertEqual({entry["executed_by"] for entry in data["results"]}, {"cashier"})
+
+    def test_search_descriptions(self):
+        data = self.results(search="RQ-007")
+        self.assertEqual([entry["description"] for entry in data["results"]], ["Updated voucher request RQ-007"])
+
+    def test_sparse_fields(self):
+        data = self.results(fields="id,action")
+        self.assertEqual(set(data["results"][0]), {"id", "action"})
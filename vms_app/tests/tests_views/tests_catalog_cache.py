@@ -0,0 +1,65 @@
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+from vms_app.models import Company, Shop
+
+
+class CatalogCacheTestCase(TestCase):
+    def setUp(self):
+        # the catalog is invalidated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company1 = Company.objects.create(company_name="Company One", prefix="CO1")
+            self.company2 = Company.objects.create(company_name="Company Two", prefix="CO2")
+            self.shop = Shop.objects.create(company=self.company1, location="Port Louis")
+            Shop.objects.create(company=self.company2, location="Grand Baie")
+        self.client = APIClient()
+
+    def test_shop_list_is_served_from_the_cache(self):
+        response = self.client.get("/vms/api/all_shops/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age", response["Cache-Control"])
+        with self.assertNumQueries(0):
+            cached = self.client.get("/vms/api/all_shops/")
+        self.assertEqual(cached.content, response.content)
+
+    def test_per_company_variants(self):
+        response = self.client.get("/vms/api/all_shops/", {"company": self.company2.id})
+        self.assertEqual([shop["location"] for shop in response.json()], ["Grand Baie"])
+        response = self.client.get("/vms/api/shops/", {"company": self.company1.id})
+        self.assertEqual([shop["location"] for shop in response.json()], ["Port Louis"])
+        with self.assertNumQueries(0):
+            response = self.client.get("/vms/api/shops/", {"company": self.company1.id})
+        self.assertEqual([shop["location"] for shop in response.json()], ["Port Louis"])
+
+    def test_saving_a_shop_or_a_company_invalidates(self):
+        first = self.client.get("/vms/api/all_shops/")
+        self.shop.location = "Port Louis Waterfront"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.save()
+        response = self.client.get("/vms/api/all_shops/")
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertEqual(response.json()[0]["location"], "Port Louis Waterfront")
+
+        self.client.get("/vms/api/all_companies/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company2.delete()
+        response = self.client.get("/vms/api/all_companies/")
+        self.assertEqual([company["company_name"] for company in response.json()], ["Company One"])
+
+    def test_etag_is_checked_without_the_database(self):
+        response = self.client.get(f"/vms/api/shops/{self.shop.id}/")
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(f"/vms/api/shops/{self.shop.id}/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_invalidated_only_on_commit(self):
+        first = self.client.get("/vms/api/all_shops/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shop.location = "Mahebourg"
+            self.shop.save()
+            # not committed yet: a list read now must not be cached under a new version
+            during = self.client.get("/vms/api/all_shops/")
+        self.assertEqual(during["ETag"], first["ETag"])
+        after = self.client.get("/vms/api/all_shops/")
+        self.assertNotEqual(after["ETag"], first["ETag"])
@@ -1,9 +1,9 @@
 from django.contrib.auth.models import Permission
 # from django.db.models import Max
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework import status
 from rest_framework.test import APIClient
-from vms_app.models import User, Client
+from vms_app.models import User, Client, VoucherRequest, AuditTrail
 
 class ClientViewsTestCase(TestCase):
     def setUp(self):
@@ -146,6 +146,42 @@ class ClientViewsTestCase(TestCase):
         )
         self.assertEqual(data['clientname'], 'updated_clientname')
 
+    @override_settings(AUDIT_TRAIL_BUFFERED=False)
+    def test_update_client_audits_changed_fields_only(self):
+        self.client.login(username='testuser', password='testpassword')
+        client = Client.objects.first()
+        response = self.client.put(f"{self.client_list_url}{client.id}/", {
+            'clientname': 'renamed_client',
+            'email': client.email,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        audit = AuditTrail.objects.get(table_name="Client", action="update")
+        self.assertEqual(audit.object_id, client.id)
+        self.assertEqual(audit.user.username, "testuser")
+        self.assertEqual(audit.changes, {"clientname": ["new_client1", "renamed_client"]})
+        self.assertEqual(
+            audit.rendered_description,
+            "Updated client 'renamed_client'\nclientname: 'new_client1' -> 'renamed_client'"
+        )
+
+    def test_client_detail_embeds_only_latest_voucher_requests(self):
+        self.client.login(username='testuser', password='testpassword')
+        User.objects.get(username='testuser').user_permissions.add(
+            Permission.objects.get(codename='view_voucherrequest')
+        )
+        client = Client.objects.first()
+        VoucherRequest.objects.bulk_create([
+            VoucherRequest(client=client, request_ref=f"VRQ-TST-25-#{index}", quantity_of_vouchers=1)
+            for index in range(1, 16)
+        ])
 
+        data = self.client.get(f"{self.client_list_url}{client.id}/").json()
+        self.assertEqual(len(data['client_voucher_requests']), 10)
 
+        response = self.client.get(f"{self.client_list_url}{client.id}/voucher_requests/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 15)
 
+        response = self.client.get(f"{self.client_list_url}999999/voucher_requests/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,93 @@
+from django.contrib.auth.models import Permission
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+from vms_app.models import User, Client, VoucherRequest, Voucher, Company, Shop
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        company = Company.objects.create(company_name="Polling Company", prefix="PLC")
+        self.shop = Shop.objects.create(company=company, location="Flacq")
+        self.user = User.objects.create_user(username='desktop_user', password='password', company=company)
+        self.user.user_permissions.add(*Permission.objects.filter(codename__in=['redeem_voucher', 'change_client']))
+        self.customer = Client.objects.create(clientname="client1", email="client1@gmail.com", contact="+230 5429 7857")
+        self.voucher_request = VoucherRequest.objects.create(
+            company=company, client=self.customer, quantity_of_vouchers=3, amount=100
+        )
+        self.voucher_request.create_provisional_vouchers()
+        Voucher.objects.update(voucher_status=Voucher.VoucherStatus.ISSUED)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_client_detail_not_modified(self):
+        url = f"/vms/api/clients/{self.customer.id}/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("ETag", response)
+        # second precision: a change in the same second would get a stale 304
+        self.assertNotIn("Last-Modified", response)
+
+        # a single validator query, nothing serialized
+        with self.assertNumQueries(1):
+            not_modified = self.revalidate(url, response)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+        self.assertEqual(not_modified.content, b"")
+
+    def test_client_detail_changes_with_its_voucher_requests(self):
+        url = f"/vms/api/clients/{self.customer.id}/"
+        response = self.client.get(url)
+        VoucherRequest.objects.create(
+            company=self.voucher_request.company, client=self.customer, quantity_of_vouchers=1, amount=50
+        )
+        self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_200_OK)
+
+    def test_voucher_request_detail(self):
+        url = f"/vms/api/voucher_requests/{self.voucher_request.id}/"
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.voucher_request.payment_remarks = "paid cash"
+        self.voucher_request.save(update_fields=["payment_remarks"])
+        self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_200_OK)
+
+    def test_voucher_detail_changes_when_it_is_redeemed(self):
+        voucher = Voucher.objects.first()
+        url = f"/vms/api/vouchers/{voucher.id}/"
+        response = self.client.get(url)
+        # read from the voucher and its redemption, loaded anyway
+        with self.assertNumQueries(1):
+            not_modified = self.revalidate(url, response)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        voucher.redeem(self.user, self.shop, till_no=1)
+        self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_200_OK)
+
+    def test_voucher_detail_changes_with_the_shop_it_was_redeemed_at(self):
+        voucher = Voucher.objects.first()
+        voucher.redeem(self.user, self.shop, till_no=1)
+        url = f"/vms/api/vouchers/{voucher.id}/"
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.shop.company.company_name = "Renamed Company"
+        self.shop.company.save()
+        renamed = self.revalidate(url, response)
+        self.assertEqual(renamed.status_code, status.HTTP_200_OK)
+        self.assertTrue(renamed.json()["redemption"]["redeemed_at"].startswith("Renamed Company"))
+
+        self.shop.location = "Mahebourg"
+        self.shop.save()
+        self.assertEqual(self.revalidate(url, renamed).status_code, status.HTTP_200_OK)
+
+    def test_lists_have_no_validators(self):
+        response = self.client.get("/vms/api/vouchers/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("ETag", response)
+
+    def test_missing_object_is_not_found(self):
+        response = self.client.get("/vms/api/clients/999999/", HTTP_IF_NONE_MATCH='"whatever"')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
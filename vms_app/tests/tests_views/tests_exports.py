@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+
+from django.contrib.auth.models import Permission
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+from vms_app.models import User, VoucherRequest, Voucher, Company, Shop
+
+
+class ExportViewsTestCase(TestCase):
+    def setUp(self):
+        company = Company.objects.create(company_name="Export Company", prefix="EXC")
+        self.shop = Shop.objects.create(company=company, location="Mahebourg")
+        self.user = User.objects.create_user(username='finance_user', password='password', company=company)
+        self.user.user_permissions.add(Permission.objects.get(codename='redeem_voucher'))
+        voucher_request = VoucherRequest.objects.create(company=company, quantity_of_vouchers=6, amount=250)
+        voucher_request.create_provisional_vouchers()
+        Voucher.objects.filter(voucher_request=voucher_request).update(
+            voucher_status=Voucher.VoucherStatus.ISSUED, amount="250.00"
+        )
+        Voucher.redeem_many(list(Voucher.objects.order_by('id')[:2]), self.user, self.shop, till_no=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, url, accept=None, **params):
+        headers = {"HTTP_ACCEPT": accept} if accept else {}
+        response = self.client.get(url, params, **headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_voucher_csv_export(self):
+        content = self.export("/vms/api/exports/vouchers/")
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual([row["id"] for row in rows], [str(pk) for pk in Voucher.objects.order_by('id').values_list('id', flat=True)])
+        self.assertEqual(rows[0]["amount"], "250.00")
+        self.assertEqual(rows[0]["company"], "Export Company")
+        self.assertEqual(rows[0]["redeemed_by"], "finance_user")
+        self.assertEqual(rows[5]["redeemed_by"], "")
+
+    def test_voucher_export_filters(self):
+        content = self.export("/vms/api/exports/vouchers/", voucher_status="redeemed", export_format="ndjson")
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({row["voucher_status"] for row in rows}, {"redeemed"})
+        self.assertEqual(rows[0]["till_no"], 3)
+
+    def test_redemption_ndjson_export(self):
+        content = self.export("/vms/api/exports/redemptions/", shop=self.shop.id, export_format="ndjson")
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["shop"], "Mahebourg")
+        self.assertEqual(rows[0]["amount"], "250.00")
+
+    def test_export_format_from_accept_header(self):
+        content = self.export("/vms/api/exports/vouchers/", accept="text/csv")
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(content)))), 6)
+
+        response = self.client.get("/vms/api/exports/redemptions/", HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 2)
+
+    def test_export_errors_answered_in_json(self):
+        response = APIClient().get("/vms/api/exports/vouchers/", HTTP_ACCEPT="text/csv")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("detail", response.json())
+
+    def test_unknown_export_format(self):
+        response = self.client.get("/vms/api/exports/voucher_requests/", {"export_format": "xlsx"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_requires_authentication(self):
+        response = APIClient().get("/vms/api/exports/vouchers/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
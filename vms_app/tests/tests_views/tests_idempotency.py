@@ -0,0 +1,78 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from vms_app.models import User, VoucherRequest, Voucher, Client, Company, IdempotencyKey
+
+
+class IdempotencyKeyTestCase(TestCase):
+    def setUp(self):
+        self.voucher_request_post_url = "/vms/api/voucher_requests/add/"
+        user = User.objects.create_user(username='user_with_perms', password='password')
+        user.user_permissions.add(*Permission.objects.filter(codename__in=[
+            'view_voucherrequest', 'add_voucherrequest',
+        ]))
+        self.client_obj = Client.objects.create(
+            clientname="idempotent_client",
+            email="idempotent_client@gmail.com",
+            contact="+230 5429 7857",
+        )
+        self.company = Company.objects.create(company_name="Idempotent Company", prefix="IDC")
+        self.client = APIClient()
+        self.client.login(username='user_with_perms', password='password')
+
+    def post_request(self, key, quantity=2):
+        return self.client.post(self.voucher_request_post_url, {
+            "quantity_of_vouchers": quantity,
+            "amount": 1000,
+            "client": self.client_obj.id,
+            "company": self.company.id,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_create_is_replayed(self):
+        first = self.post_request("retry-key-1")
+        retry = self.post_request("retry-key-1")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry.headers.get("Idempotent-Replayed"), "true")
+        self.assertEqual(VoucherRequest.objects.count(), 1, "a retried create must not create a duplicate request")
+        self.assertEqual(Voucher.objects.count(), 2)
+
+    def test_key_reused_for_a_different_request(self):
+        self.post_request("retry-key-2")
+        response = self.post_request("retry-key-2", quantity=5)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(VoucherRequest.objects.count(), 1)
+
+    def test_requests_without_key_are_not_stored(self):
+        self.post_request("")
+        self.assertEqual(IdempotencyKey.objects.count(), 0)
+
+    def test_purge_expired_keys(self):
+        self.post_request("fresh-key")
+        self.post_request("old-key")
+        IdempotencyKey.objects.filter(key="old-key").update(expires_at=timezone.now() - timedelta(minutes=1))
+        call_command("purge_idempotency_keys", stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list("key", flat=True)), ["fresh-key"])
+
+    def test_in_flight_key_is_taken_over_after_its_lease(self):
+        # the first request died before storing its response
+        self.post_request("crashed-key")
+        IdempotencyKey.objects.filter(key="crashed-key").update(
+            response_status=None, response_body=None, locked_until=timezone.now() + timedelta(minutes=1)
+        )
+        self.assertEqual(self.post_request("crashed-key").status_code, status.HTTP_409_CONFLICT)
+
+        IdempotencyKey.objects.filter(key="crashed-key").update(locked_until=timezone.now() - timedelta(seconds=1))
+        retry = self.post_request("crashed-key")
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", retry)
+        stored = IdempotencyKey.objects.get(key="crashed-key")
+        self.assertEqual(stored.response_status, status.HTTP_201_CREATED)
+        self.assertIsNone(stored.locked_until)
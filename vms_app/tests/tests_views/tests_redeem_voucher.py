@@ -0,0 +1,223 @@
+from django.contrib.auth.models import Permission
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+from vms_app.models import (
+    User, VoucherRequest, Voucher, Company,
+    Shop, Redemption, AuditTrail, RedemptionConflict
+)
+
+
+class RedeemVoucherViewTestCase(TestCase):
+    def setUp(self):
+        company = Company.objects.create(company_name="Redeem Company", prefix="RDC")
+        self.shop = Shop.objects.create(company=company, location="Port Louis")
+        self.user = User.objects.create_user(username='shop_user', password='password', company=company)
+        self.user.user_permissions.add(Permission.objects.get(codename='redeem_voucher'))
+        voucher_request = VoucherRequest.objects.create(company=company, quantity_of_vouchers=2, amount=500)
+        vouchers = voucher_request.create_provisional_vouchers()
+        Voucher.objects.filter(voucher_request=voucher_request).update(voucher_status=Voucher.VoucherStatus.ISSUED)
+        self.voucher = Voucher.objects.get(voucher_ref=vouchers[0].voucher_ref)
+        self.client = APIClient()
+        self.client.login(username='shop_user', password='password')
+
+    def redeem_url(self, voucher):
+        return f"/vms/api/vouchers/{voucher.id}/redeem/"
+
+    # audit entries written right away (TestCase never commits)
+    @override_settings(AUDIT_TRAIL_BUFFERED=False)
+    def test_redeem_issued_voucher(self):
+        response = self.client.post(self.redeem_url(self.voucher), {"shop_id": self.shop.id, "till_no": 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()
+        self.assertEqual(data["voucher_info"]["voucher_ref"], self.voucher.voucher_ref)
+        self.assertEqual(data["voucher_info"]["redemption"]["redeemed_at"], "Redeem Company Port Louis")
+
+        self.voucher.refresh_from_db()
+        self.assertEqual(self.voucher.voucher_status, Voucher.VoucherStatus.REDEEMED)
+        self.assertEqual(self.voucher.redemption.till_no, 3)
+        self.assertTrue(AuditTrail.objects.filter(table_name="Redemption").exists())
+
+    def test_redeem_twice_returns_conflict(self):
+        self.client.post(self.redeem_url(self.voucher), {"shop_id": self.shop.id}, format='json')
+        response = self.client.post(self.redeem_url(self.voucher), {"shop_id": self.shop.id}, format='json')
+        self.assertEqual(
+            response.status_code, status.HTTP_409_CONFLICT,
+            f"a voucher redeemed twice must return 409, but got {response.status_code}"
+        )
+        self.assertEqual(Redemption.objects.filter(voucher=self.voucher).count(), 1)
+
+    def test_lost_race_raises_conflict(self):
+        """the till read the voucher as issued but another till redeemed it meanwhile"""
+        stale_voucher = Voucher.objects.get(pk=self.voucher.pk)
+        self.voucher.redeem(user=self.user, shop=self.shop, till_no=1)
+        with self.assertRaises(RedemptionConflict):
+            stale_voucher.redeem(user=self.user, shop=self.shop, till_no=2)
+        self.assertEqual(Redemption.objects.filter(voucher=self.voucher).count(), 1)
+
+    def test_redeem_provisional_voucher(self):
+        Voucher.objects.filter(pk=self.voucher.pk).update(voucher_status=Voucher.VoucherStatus.PROVISIONAL)
+        response = self.client.post(self.redeem_url(self.voucher), {"shop_id": self.shop.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_redeem_with_malformed_shop_id(self):
+        response = self.client.post(self.redeem_url(self.voucher), {"shop_id": "not-an-id"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn("ISSUED", response.json()["details"])
+        self.voucher.refresh_from_db()
+        self.assertEqual(self.voucher.voucher_status, Voucher.VoucherStatus.ISSUED)
+
+    def test_redeem_unknown_voucher(self):
+        response = self.client.post("/vms/api/vouchers/999999/redeem/", {"shop_id": self.shop.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_redeem_by_voucher_ref(self):
+        response = self.client.post(
+            f"/vms/api/vouchers/ref/{self.voucher.voucher_ref}/redeem/", {"shop_id": self.shop.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.voucher.refresh_from_db()
+        self.assertEqual(self.voucher.voucher_status, Voucher.VoucherStatus.REDEEMED)
+
+    def test_lookup_by_voucher_ref(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='view_voucher'))
+        response = self.client.get(f"/vms/api/vouchers/ref/{self.voucher.voucher_ref}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["id"], self.voucher.id)
+        response = self.client.get("/vms/api/vouchers/ref/UNKNOWN-REF/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_vouchers_by_ref_prefix(self):
+        response = self.client.get("/vms/api/vouchers/", {"search": self.voucher.voucher_ref.lower()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([voucher["id"] for voucher in response.json()["results"]], [self.voucher.id])
+        response = self.client.get("/vms/api/vouchers/", {"search": "rdc-"})
+        self.assertEqual(response.json()["count"], 2)
+
+
+class BatchRedeemVoucherViewTestCase(TestCase):
+    def setUp(self):
+        self.batch_redeem_url = "/vms/api/vouchers/batch/redeem/"
+        company = Company.objects.create(company_name="Batch Company", prefix="BTC")
+        self.shop = Shop.objects.create(company=company, location="Curepipe")
+        user = User.objects.create_user(username='shop_user', password='password', company=company)
+        user.user_permissions.add(Permission.objects.get(codename='redeem_voucher'))
+        voucher_request = VoucherRequest.objects.create(company=company, quantity_of_vouchers=3, amount=200)
+        voucher_request.create_provisional_vouchers()
+        Voucher.objects.filter(voucher_request=voucher_request).update(voucher_status=Voucher.VoucherStatus.ISSUED)
+        self.vouchers = list(Voucher.objects.filter(voucher_request=voucher_request).order_by('id'))
+        self.client = APIClient()
+        self.client.login(username='shop_user', password='password')
+
+    # audit entries written right away (TestCase never commits)
+    @override_settings(AUDIT_TRAIL_BUFFERED=False)
+    def test_batch_redeem_by_ids_and_refs(self):
+        response = self.client.post(self.batch_redeem_url, {
+            "vouchers": [self.vouchers[0].id, self.vouchers[1].voucher_ref],
+            "shop_id": self.shop.id,
+            "till_no": 2,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()
+        self.assertEqual(data["redeemed"], 2)
+        self.assertEqual([result["status"] for result in data["results"]], ["redeemed", "redeemed"])
+        self.assertEqual(Redemption.objects.filter(shop=self.shop, till_no=2).count(), 2)
+        self.assertEqual(AuditTrail.objects.filter(table_name="Redemption").count(), 2)
+
+    def test_all_or_nothing_redeems_nothing_when_one_voucher_fails(self):
+        self.vouchers[2].redeem(user=User.objects.get(username='shop_user'), shop=self.shop, till_no=1)
+        response = self.client.post(self.batch_redeem_url, {
+            "vouchers": [self.vouchers[0].id, self.vouchers[2].id],
+            "shop_id": self.shop.id,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(
+            [result["status"] for result in response.json()["results"]],
+            ["not_redeemed", "already_redeemed"]
+        )
+        self.vouchers[0].refresh_from_db()
+        self.assertEqual(self.vouchers[0].voucher_status, Voucher.VoucherStatus.ISSUED)
+
+    def test_partial_mode_redeems_valid_vouchers(self):
+        response = self.client.post(self.batch_redeem_url, {
+            "vouchers": [self.vouchers[0].id, "UNKNOWN-REF"],
+            "shop_id": self.shop.id,
+            "mode": "partial",
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [result["status"] for result in response.json()["results"]],
+            ["redeemed", "not_found"]
+        )
+
+
+class OfflineRedemptionSyncViewTestCase(TestCase):
+    def setUp(self):
+        self.sync_url = "/vms/api/redemptions/offline/sync/"
+        company = Company.objects.create(company_name="Offline Company", prefix="OFC")
+        self.shop = Shop.objects.create(company=company, location="Rose Hill")
+        self.other_shop = Shop.objects.create(company=company, location="Flacq")
+        self.user = User.objects.create_user(username='shop_user', password='password', company=company)
+        self.user.user_permissions.add(Permission.objects.get(codename='redeem_voucher'))
+        voucher_request = VoucherRequest.objects.create(company=company, quantity_of_vouchers=3, amount=300)
+        voucher_request.create_provisional_vouchers()
+        Voucher.objects.filter(voucher_request=voucher_request).update(voucher_status=Voucher.VoucherStatus.ISSUED)
+        self.refs = list(
+            Voucher.objects.filter(voucher_request=voucher_request).order_by('id').values_list('voucher_ref', flat=True)
+        )
+        self.client = APIClient()
+        self.client.login(username='shop_user', password='password')
+
+    def test_sync_applies_redemptions_in_chronological_order(self):
+        response = self.client.post(self.sync_url, {"redemptions": [
+            {"local_id": "b", "voucher_ref": self.refs[0], "shop_id": self.other_shop.id,
+             "till_no": 2, "redeemed_at": "2025-03-01T10:05:00"},
+            {"local_id": "a", "voucher_ref": self.refs[0], "shop_id": self.shop.id,
+             "till_no": 1, "redeemed_at": "2025-03-01T10:00:00"},
+            {"local_id": "c", "voucher_ref": self.refs[1], "shop_id": self.shop.id,
+             "till_no": 1, "redeemed_at": "2025-03-01T10:10:00"},
+            {"local_id": "d", "voucher_ref": "UNKNOWN-REF", "shop_id": self.shop.id,
+             "redeemed_at": "2025-03-01T10:15:00"},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual(data["applied"], 2)
+        self.assertEqual(data["conflicts"], 1)
+        self.assertEqual(
+            [(result["local_id"], result["status"]) for result in data["results"]],
+            [("b", "conflict"), ("a", "redeemed"), ("c", "redeemed"), ("d", "rejected")]
+        )
+        self.assertEqual(data["results"][0]["redemption"]["redeemed_at"], "Offline Company Rose Hill")
+
+        redemption = Redemption.objects.get(voucher__voucher_ref=self.refs[0])
+        self.assertEqual((redemption.shop, redemption.till_no), (self.shop, 1))
+        self.assertEqual(redemption.redemption_date.minute, 0, "the till's redemption time must be kept")
+
+    def test_sync_reports_vouchers_redeemed_online(self):
+        voucher = Voucher.objects.get(voucher_ref=self.refs[2])
+        voucher.redeem(user=self.user, shop=self.other_shop, till_no=4)
+        response = self.client.post(self.sync_url, {"redemptions": [
+            {"voucher_ref": self.refs[2], "shop_id": self.shop.id, "redeemed_at": "2025-03-01T09:00:00"},
+        ]}, format='json')
+        self.assertEqual(response.json()["results"][0]["status"], "conflict")
+        self.assertEqual(Redemption.objects.get(voucher=voucher).shop, self.other_shop)
+
+    def test_sync_attributes_redemptions_to_colleagues_only(self):
+        colleague = User.objects.create_user(username='colleague', password='password', company=self.user.company)
+        outsider = User.objects.create_user(
+            username='outsider', password='password',
+            company=Company.objects.create(company_name="Other Company", prefix="OTC")
+        )
+        for user in (colleague, outsider):
+            user.user_permissions.add(Permission.objects.get(codename='redeem_voucher'))
+        response = self.client.post(self.sync_url, {"redemptions": [
+            {"voucher_ref": self.refs[0], "shop_id": self.shop.id, "user_id": colleague.id,
+             "redeemed_at": "2025-03-01T09:00:00"},
+            {"voucher_ref": self.refs[1], "shop_id": self.shop.id, "user_id": outsider.id,
+             "redeemed_at": "2025-03-01T09:05:00"},
+        ]}, format='json')
+        self.assertEqual(
+            [result["status"] for result in response.json()["results"]], ["redeemed", "rejected"]
+        )
+        self.assertEqual(Redemption.objects.get(voucher__voucher_ref=self.refs[0]).user, colleague)
+        self.assertFalse(Redemption.objects.filter(voucher__voucher_ref=self.refs[1]).exists())
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime, date
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+import msgpack
+from django.contrib.auth.models import Permission
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from vms_app.models import User, VoucherRequest, Voucher, Company, Shop
+from vms_app.renderers import ORJSONRenderer, MessagePackRenderer
+
+
+class RenderersTestCase(TestCase):
+    def setUp(self):
+        self.voucher_list_url = "/vms/api/vouchers/"
+        company = Company.objects.create(company_name="Render Company", prefix="RDC")
+        shop = Shop.objects.create(company=company, location="Rose Hill")
+        self.user = User.objects.create_user(username='render_user', password='password', company=company)
+        self.user.user_permissions.add(Permission.objects.get(codename='redeem_voucher'))
+        voucher_request = VoucherRequest.objects.create(company=company, quantity_of_vouchers=4, amount=Decimal("150.50"))
+        voucher_request.create_provisional_vouchers()
+        Voucher.objects.filter(voucher_request=voucher_request).update(voucher_status=Voucher.VoucherStatus.ISSUED)
+        Voucher.redeem_many(list(Voucher.objects.all()[:2]), self.user, shop, till_no=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_orjson_output_matches_drf_json(self):
+        data = {
+            "amount": Decimal("150.50"),
+            "utc": datetime(2025, 3, 1, 10, 30, 5, 120000, tzinfo=ZoneInfo("UTC")),
+            "local": datetime(2025, 3, 1, 14, 30, tzinfo=ZoneInfo("Indian/Mauritius")),
+            "day": date(2025, 3, 1),
+            "text": "Curepipe   Réduit",
+            1: [None, True, 1.5],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_voucher_list_json_is_unchanged(self):
+        response = self.client.get(self.voucher_list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_voucher_list_in_messagepack(self):
+        json_data = self.client.get(self.voucher_list_url).json()
+        response = self.client.get(self.voucher_list_url, HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], MessagePackRenderer.media_type)
+        self.assertEqual(msgpack.unpackb(response.content), json_data)
+
+    def test_messagepack_request_body(self):
+        voucher = Voucher.objects.filter(voucher_status=Voucher.VoucherStatus.ISSUED).first()
+        body = msgpack.packb({"vouchers": [voucher.voucher_ref], "shop_id": Shop.objects.get().id, "till_no": 2})
+        response = self.client.post(
+            "/vms/api/vouchers/batch/redeem/", body, content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(data["redeemed"], 1)
+        self.assertEqual(data, json.loads(JSONRenderer().render(response.data)))
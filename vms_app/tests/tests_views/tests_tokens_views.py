@@ -1,9 +1,22 @@
 # from django.contrib.auth.models import Permission
 # from django.db.models import Max
-from django.test import TestCase
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import Permission
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
-from vms_app.models import User
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from vms_app.authentication import check_stateless_claims_cache
+from vms_app.models import User, Company, VoucherRequest, Voucher
 
 class TokenViewsTestCase(TestCase):
     def setUp(self):
@@ -133,4 +146,122 @@ class TokenViewsTestCase(TestCase):
         response = self.client.post(self.token_refresh_url, {
             'refresh': new_refresh_token
         })
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+@override_settings(JWT_STATELESS_CLAIMS=True)
+class StatelessClaimsTestCase(TestCase):
+    def setUp(self):
+        self.company = Company.objects.create(company_name="Claims Company", prefix="CLC")
+        self.user = User.objects.create_user(username='cashier', password='testpassword', company=self.company)
+        self.user.user_permissions.add(Permission.objects.get(codename='view_voucher'))
+        voucher_request = VoucherRequest.objects.create(company=self.company, quantity_of_vouchers=1, amount=100)
+        voucher_request.create_provisional_vouchers()
+        self.voucher = Voucher.objects.get(voucher_request=voucher_request)
+        self.client = APIClient()
+        access = self.client.post("/vms/auth/token/", {'username': 'cashier', 'password': 'testpassword'}).json()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.access = AccessToken(access)
+
+    def user_lookups(self):
+        """ (status of a voucher lookup, whether the user row was read to authenticate it) """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/vms/api/vouchers/ref/{self.voucher.voucher_ref}/")
+        lookups = [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'FROM "vms_app_user" WHERE' in query['sql']]
+        return response.status_code, bool(lookups)
+
+    def test_claims_in_access_token(self):
+        self.assertEqual(self.access['username'], 'cashier')
+        self.assertEqual(self.access['company'], self.company.id)
+        self.assertFalse(self.access['is_staff'])
+        self.assertIn('pv', self.access)
+
+    def test_user_not_read_while_claims_are_current(self):
+        self.assertEqual(self.user_lookups(), (status.HTTP_200_OK, False))
+
+    def test_changed_permissions_revoke_the_claims(self):
+        self.user.user_permissions.clear()
+        # stale stamp: the user is read from the database again
+        self.assertEqual(self.user_lookups(), (status.HTTP_200_OK, True))
+
+    def test_deactivated_user_is_rejected(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.user_lookups()[0], status.HTTP_401_UNAUTHORIZED)
+
+    def test_refused_without_a_shared_cache(self):
+        # (the tests run in a single process: the local memory cache is enough for them)
+        with self.assertRaises(ImproperlyConfigured):
+            check_stateless_claims_cache()
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}
+        with override_settings(CACHES=redis):
+            check_stateless_claims_cache()
+
+    def test_refresh_stamps_current_claims(self):
+        refresh = self.client.post("/vms/auth/token/", {'username': 'cashier', 'password': 'testpassword'}).json()['refresh']
+        self.user.user_permissions.add(Permission.objects.get(codename='change_voucher'))
+        access = AccessToken(self.client.post("/vms/auth/token/refresh/", {'refresh': refresh}).json()['access'])
+        self.assertNotEqual(access['pv'], self.access['pv'])
+        self.assertEqual(access['username'], 'cashier')
+
+
+class TokenBlacklistTestCase(TestCase):
+    def setUp(self):
+        User.objects.create_user(username='usertest', password='testpassword')
+        self.client = APIClient()
+        self.refresh = self.client.post(
+            "/vms/auth/token/", {'username': 'usertest', 'password': 'testpassword'}
+        ).json()['refresh']
+
+    def test_rotated_token_rejected_from_the_cache(self):
+        response = self.client.post("/vms/auth/token/refresh/", {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/vms/auth/token/refresh/", {'refresh': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse([query for query in queries if 'token_blacklist' in query['sql']])
+
+        response = self.client.post("/vms/auth/token/verify/", {'token': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_blacklist_checked_in_the_database_until_blacklisted(self):
+        # seen as valid first: with the local memory cache, that answer is not cached
+        response = self.client.post("/vms/auth/token/verify/", {'token': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        outstanding = OutstandingToken.objects.get(jti=RefreshToken(self.refresh, verify=False)['jti'])
+        # blacklisted behind this process' back (another worker): no cache update
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=outstanding)])
+        response = self.client.post("/vms/auth/token/verify/", {'token': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_valid_token_checked_from_a_shared_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+            with override_settings(CACHES=shared):
+                self.client.post("/vms/auth/token/verify/", {'token': self.refresh})
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.post("/vms/auth/token/verify/", {'token': self.refresh})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertFalse([query for query in queries if 'token_blacklist' in query['sql']])
+
+                # the rotation blacklists the token: the cached answer is replaced
+                self.client.post("/vms/auth/token/refresh/", {'refresh': self.refresh})
+                response = self.client.post("/vms/auth/token/verify/", {'token': self.refresh})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unblacklisted_token_is_accepted_again(self):
+        self.client.post("/vms/auth/token/refresh/", {'refresh': self.refresh})
+        BlacklistedToken.objects.get().delete()
+        response = self.client.post("/vms/auth/token/verify/", {'token': self.refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_prune_tokens(self):
+        self.client.post("/vms/auth/token/refresh/", {'refresh': self.refresh})
+        # a second session, still valid
+        self.client.post("/vms/auth/token/", {'username': 'usertest', 'password': 'testpassword'})
+        OutstandingToken.objects.filter(jti=RefreshToken(self.refresh, verify=False)['jti']).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        call_command("prune_tokens", "--batch-size", "1", stdout=StringIO())
+        self.assertEqual(OutstandingToken.objects.count(), 1, "the valid token is kept")
+        self.assertEqual(BlacklistedToken.objects.count(), 0)
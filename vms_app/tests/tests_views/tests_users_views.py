@@ -0,0 +1,103 @@
+from django.contrib.auth.models import Permission, Group
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+from vms_app.backends import permissions_cache_key
+from vms_app.models import User, AuditTrail
+
+
+class UserViewsTestCase(TestCase):
+    def setUp(self):
+        self.user_list_url = "/vms/api/users/"
+        self.admin = User.objects.create_user(username='admin_user', password='password', is_staff=True)
+        self.admin.user_permissions.add(Permission.objects.get(codename='view_user'))
+        self.group = Group.objects.create(name='supervisors')
+        self.group.permissions.add(Permission.objects.get(codename='redeem_voucher'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def create_users(self, count):
+        for index in range(count):
+            user = User.objects.create_user(username=f'user_{User.objects.count()}', password='password')
+            user.groups.add(self.group)
+            user.user_permissions.add(Permission.objects.get(codename='view_voucher'))
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.user_list_url, {"page_size": 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_user_list_query_count_is_constant(self):
+        self.create_users(2)
+        # warm the permission cache of the authenticated user
+        self.list_queries()
+        few_users_queries = self.list_queries()
+        self.create_users(10)
+        self.assertEqual(self.list_queries(), few_users_queries)
+
+        user = User.objects.get(username='user_1')
+        data = self.client.get(f"{self.user_list_url}{user.id}/").json()
+        self.assertEqual(data["user_groups"], ["supervisors"])
+        self.assertEqual(data["permissions"], ["view_voucher"])
+
+    def test_cached_permissions_are_invalidated(self):
+        user = User.objects.create_user(username='cashier', password='password')
+        self.assertFalse(User.objects.get(pk=user.pk).has_perm('vms_app.redeem_voucher'))
+
+        user.groups.add(self.group)
+        self.assertTrue(User.objects.get(pk=user.pk).has_perm('vms_app.redeem_voucher'))
+
+        self.group.permissions.remove(Permission.objects.get(codename='redeem_voucher'))
+        self.assertFalse(User.objects.get(pk=user.pk).has_perm('vms_app.redeem_voucher'))
+
+        user.user_permissions.add(Permission.objects.get(codename='redeem_voucher'))
+        self.assertTrue(User.objects.get(pk=user.pk).has_perm('vms_app.redeem_voucher'))
+        with self.assertNumQueries(1):
+            # only the user is loaded: the permission set comes from the cache
+            self.assertTrue(User.objects.get(pk=user.pk).has_perm('vms_app.redeem_voucher'))
+
+    def test_permissions_cached_before_the_commit_are_dropped(self):
+        user = User.objects.create_user(username='cashier', password='password')
+        user.groups.add(self.group)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.groups.remove(self.group)
+            # a concurrent request caching the permission set before the revocation is committed
+            cache.set(permissions_cache_key(user.pk), {'vms_app.redeem_voucher'})
+        self.assertIsNone(cache.get(permissions_cache_key(user.pk)))
+        self.assertFalse(User.objects.get(pk=user.pk).has_perm('vms_app.redeem_voucher'))
+
+    def test_user_permissions_endpoint(self):
+        user = User.objects.create_user(username='cashier', password='password')
+        user.groups.add(self.group)
+        user.user_permissions.add(Permission.objects.get(codename='view_voucher'))
+        response = self.client.get(f"/vms/auth/users/{user.id}/permissions/")
+        self.assertEqual(
+            sorted(response.json()["current_user_permissions"]), ["redeem_voucher", "view_voucher"]
+        )
+
+    def test_user_list_fields_skip_prefetches(self):
+        self.create_users(3)
+        self.list_queries()
+        all_fields_queries = self.list_queries()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.user_list_url, {"fields": "id,username"})
+        self.assertEqual(set(response.json()["results"][0]), {"id", "username"})
+        # groups and permissions are no longer prefetched
+        self.assertEqual(len(queries), all_fields_queries - 2)
+
+    @override_settings(AUDIT_TRAIL_BUFFERED=False)
+    def test_user_update_audits_changed_fields_only(self):
+        self.admin.user_permissions.add(Permission.objects.get(codename='change_user'))
+        user = User.objects.create_user(username='cashier', password='password', first_name='Anna')
+        response = self.client.patch(f"{self.user_list_url}{user.id}/", {"first_name": "Anne"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        audit = AuditTrail.objects.get(table_name="User", action="update")
+        self.assertEqual(audit.object_id, user.id)
+        self.assertEqual(audit.user, self.admin)
+        self.assertEqual(audit.changes, {"first_name": ["Anna", "Anne"]})
+        self.assertIn("first_name: 'Anna' -> 'Anne'", audit.rendered_description)
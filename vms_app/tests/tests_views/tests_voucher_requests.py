@@ -1,11 +1,15 @@
 from typing import assert_never
+from unittest import mock
 
 from django.contrib.auth.models import Permission, Group
 # from django.db.models import Max
-from django.test import TestCase
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIClient
-from vms_app.models import User, VoucherRequest, Voucher, Client, Company
+from vms_app.models import User, VoucherRequest, Voucher, Client, Company, AuditTrail, RefSequence
+from vms_app.serializers import VoucherRequestCrudSerializer
 
 
 class ClientViewsTestCase(TestCase):
@@ -109,6 +113,65 @@ class ClientViewsTestCase(TestCase):
             "The number of related vouchers must be equal to quantity_of_vouchers (2)"
         )
 
+    def test_voucher_request_without_vouchers_is_rejected(self):
+        self.client.login(username='user_with_perms', password='password')
+        client = Client.objects.first()
+        for quantity in (0, -3):
+            response = self.client.post(self.voucher_request_post_url, {
+                "quantity_of_vouchers": quantity,
+                "amount": 1000,
+                "client": client.id,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("quantity_of_vouchers", response.json())
+        self.assertEqual(VoucherRequest.objects.count(), 1)
+
+    def test_refs_are_reserved_before_the_request_is_written(self):
+        """the counters are updated outside the transaction writing the request: a failed creation leaves a gap"""
+        company = Company.objects.create(company_name="Gap Company", prefix="GC")
+        data = {"quantity_of_vouchers": 3, "amount": 500, "company": company.id}
+        serializer = VoucherRequestCrudSerializer(data=data)
+        self.assertTrue(serializer.is_valid())
+        with mock.patch.object(VoucherRequest, "create_provisional_vouchers", side_effect=IntegrityError("failed")):
+            with self.assertRaises(ValidationError):
+                serializer.save()
+        self.assertFalse(VoucherRequest.objects.filter(company=company).exists())
+        self.assertEqual(RefSequence.objects.get(kind=RefSequence.SequenceKind.REQUEST).last_value, 1)
+        self.assertEqual(RefSequence.objects.get(kind=RefSequence.SequenceKind.VOUCHER, prefix="GC").last_value, 3)
+
+        serializer = VoucherRequestCrudSerializer(data=data)
+        self.assertTrue(serializer.is_valid())
+        voucher_request = serializer.save()
+        self.assertTrue(voucher_request.request_ref.endswith("-#2"))
+        self.assertTrue(voucher_request.vouchers.order_by("id").first().voucher_ref.endswith("-0004"))
+
+    # audit entries written right away (TestCase never commits)
+    @override_settings(AUDIT_TRAIL_BUFFERED=False)
+    def test_vouchers_issued_in_bulk_with_one_audit_entry(self):
+        self.client.login(username='user_with_perms', password='password')
+        client = Client.objects.first()
+        company = Company.objects.create(company_name="Bulk Company", prefix="BC")
+        response = self.client.post(self.voucher_request_post_url, {
+            "quantity_of_vouchers": 25,
+            "amount": 500,
+            "client": client.id,
+            "company": company.id,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        voucher_request = VoucherRequest.objects.get(pk=response.json()['id'])
+        refs = list(voucher_request.vouchers.order_by('id').values_list('voucher_ref', flat=True))
+        self.assertEqual(len(refs), 25)
+        self.assertEqual(len(set(refs)), 25, "voucher refs must be unique")
+        self.assertTrue(refs[-1].endswith("-0025"))
+        self.assertEqual(
+            AuditTrail.objects.filter(
+                table_name="VoucherRequest", object_id=voucher_request.id,
+                description__contains="provisional vouchers"
+            ).count(),
+            1,
+            "a single audit entry must be written for the whole batch of vouchers"
+        )
 
     def test_change_voucher_request_status_to_paid(self):
         self.client.login(username='user_with_perms', password='password')
@@ -0,0 +1,125 @@
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+from vms_app.models import User, VoucherRequest, Voucher, Company, Shop
+
+
+class VoucherListQueriesTestCase(TestCase):
+    def setUp(self):
+        self.voucher_list_url = "/vms/api/vouchers/"
+        company = Company.objects.create(company_name="List Company", prefix="LSC")
+        shop = Shop.objects.create(company=company, location="Port Louis")
+        self.user = User.objects.create_user(username='list_user', password='password', company=company)
+        self.user.user_permissions.add(Permission.objects.get(codename='redeem_voucher'))
+        voucher_request = VoucherRequest.objects.create(company=company, quantity_of_vouchers=120, amount=100)
+        voucher_request.create_provisional_vouchers()
+        Voucher.objects.filter(voucher_request=voucher_request).update(voucher_status=Voucher.VoucherStatus.ISSUED)
+        Voucher.redeem_many(
+            list(Voucher.objects.filter(voucher_request=voucher_request)), self.user, shop, till_no=1
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def list_queries(self, page_size):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.voucher_list_url, {"page_size": page_size})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()["results"]
+        self.assertEqual(len(results), page_size)
+        self.assertEqual(results[0]["redemption"]["redeemed_at"], "List Company Port Louis")
+        self.assertEqual(results[0]["redemption"]["redeemed_by"], "list_user")
+        return len(queries)
+
+    def test_voucher_list_query_count_does_not_grow_with_page_size(self):
+        queries_page_10 = self.list_queries(10)
+        queries_page_100 = self.list_queries(100)
+        self.assertEqual(
+            queries_page_10, queries_page_100,
+            "the number of queries of the voucher list must not depend on the page size"
+        )
+        # COUNT(*) for the pagination + one SELECT joining redemption, shop, company and user
+        self.assertLessEqual(queries_page_100, 2)
+
+    def test_voucher_detail_query_count(self):
+        voucher = Voucher.objects.first()
+        with self.assertNumQueries(1):
+            response = self.client.get(f"{self.voucher_list_url}{voucher.id}/")
+        self.assertEqual(response.json()["redemption"]["redeemed_by"], "list_user")
+
+    def test_voucher_list_cursor_pagination(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.voucher_list_url, {"pagination": "cursor", "page_size": 50})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        # no COUNT(*) in cursor mode
+        self.assertNotIn("count", data)
+        self.assertIsNone(data["previous"])
+        ids = [voucher["id"] for voucher in data["results"]]
+
+        while data["next"]:
+            data = self.client.get(data["next"]).json()
+            ids += [voucher["id"] for voucher in data["results"]]
+        self.assertEqual(ids, list(Voucher.objects.order_by("id").values_list("id", flat=True)))
+
+    def test_voucher_list_keeps_page_number_contract(self):
+        response = self.client.get(self.voucher_list_url, {"page": 2})
+        data = response.json()
+        self.assertEqual(data["count"], 120)
+        self.assertEqual(len(data["results"]), 10)
+
+
+class VoucherSparseFieldsetTestCase(TestCase):
+    def setUp(self):
+        self.voucher_list_url = "/vms/api/vouchers/"
+        company = Company.objects.create(company_name="Till Company", prefix="TLC")
+        shop = Shop.objects.create(company=company, location="Curepipe")
+        self.user = User.objects.create_user(username='till_user', password='password', company=company)
+        self.user.user_permissions.add(Permission.objects.get(codename='redeem_voucher'))
+        voucher_request = VoucherRequest.objects.create(company=company, quantity_of_vouchers=5, amount=100)
+        voucher_request.create_provisional_vouchers()
+        Voucher.objects.filter(voucher_request=voucher_request).update(voucher_status=Voucher.VoucherStatus.ISSUED)
+        Voucher.redeem_many(
+            list(Voucher.objects.filter(voucher_request=voucher_request)), self.user, shop, till_no=1
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_vouchers(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.voucher_list_url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()["results"], queries
+
+    def test_fields_narrow_payload_and_query(self):
+        results, queries = self.get_vouchers(fields="id,voucher_ref,amount,voucher_status,expiry_date")
+        self.assertEqual(
+            set(results[0]), {"id", "voucher_ref", "amount", "voucher_status", "expiry_date"}
+        )
+        select = queries.captured_queries[-1]["sql"]
+        # the redemption is neither joined nor loaded
+        self.assertNotIn("vms_app_redemption", select)
+        self.assertNotIn("date_time_created", select)
+
+    def test_nested_fields(self):
+        results, queries = self.get_vouchers(fields="voucher_ref,redemption.redeemed_by")
+        self.assertEqual(set(results[0]), {"voucher_ref", "redemption"})
+        self.assertEqual(results[0]["redemption"], {"redeemed_by": "till_user"})
+
+    def test_omit(self):
+        results, queries = self.get_vouchers(omit="redemption,date_time_created")
+        self.assertNotIn("redemption", results[0])
+        self.assertNotIn("date_time_created", results[0])
+        self.assertIn("voucher_ref", results[0])
+        self.assertNotIn("vms_app_redemption", queries.captured_queries[-1]["sql"])
+
+        results, queries = self.get_vouchers(omit="redemption.redeemed_at")
+        self.assertEqual(set(results[0]["redemption"]), {"id", "redeemed_on", "till_no", "redeemed_by", "voucher"})
+
+    def test_voucher_detail_fields(self):
+        voucher = Voucher.objects.first()
+        with self.assertNumQueries(1):
+            response = self.client.get(f"{self.voucher_list_url}{voucher.id}/", {"fields": "id,voucher_ref"})
+        self.assertEqual(response.json(), {"id": voucher.id, "voucher_ref": voucher.voucher_ref})
@@ -10,14 +10,17 @@ from rest_framework_simplejwt.views import (
     TokenVerifyView,
 )
 from .views import (
-    UserViewSet, VoucherViewSet, CompanyViewSet, ShopViewSet,
+    UserViewSet, VoucherViewSet, VoucherByRefView, CompanyViewSet, ShopViewSet,
     VoucherRequestListView, VoucherRequestCrudView, VoucherRequestCreateView,
-    ClientListView, ClientCRUDView, ClientCreateView,
-    RedemptionViewSet, RedeemVoucherView, AuditTrailsViewset,
+    ClientListView, ClientCRUDView, ClientCreateView, ClientVoucherRequestsView,
+    RedemptionViewSet, RedeemVoucherView, BatchRedeemVoucherView, OfflineRedemptionSyncView,
+    AuditTrailsViewset,
     password_reset_confirm, password_reset_success_view,
     GroupViewSet, PermissionListViewSet, approve_request_view, index, login_view, logout_view,
     password_reset_send_email, request_approved_success_view, not_found_view, get_user_perms,
-    ShopList, CompanyList, ChangePasswordView, send_reset_password_link
+    ShopList, CompanyList, ChangePasswordView, send_reset_password_link,
+    CompanyLogoView, ClientLogoView, UserSignatureView,
+    VoucherExportView, RedemptionExportView, VoucherRequestExportView
 )
 
 router = DefaultRouter()
@@ -52,6 +55,10 @@ urlpatterns = [
     path("vms/api/clients/", ClientListView.as_view(), name="clients_list"),
     path("vms/api/clients/<int:pk>/", ClientCRUDView.as_view(), name="client_details"),
     path("vms/api/clients/add/", ClientCreateView.as_view(), name="new_client"),
+    path(
+        "vms/api/clients/<int:pk>/voucher_requests/",
+        ClientVoucherRequestsView.as_view(), name="client_voucher_requests"
+    ),
 
     # -------- urls related to voucher_request model ----------
     path("vms/api/voucher_requests/", VoucherRequestListView.as_view(), name="requests_list"),
@@ -60,10 +67,30 @@ urlpatterns = [
 
     #------------------- Redeem voucher -------------------------------
     path("vms/api/vouchers/<int:pk>/redeem/",  RedeemVoucherView.as_view(), name="redeem_voucher"),
+    path("vms/api/vouchers/batch/redeem/", BatchRedeemVoucherView.as_view(), name="batch_redeem_vouchers"),
+    path("vms/api/vouchers/ref/<str:voucher_ref>/", VoucherByRefView.as_view(), name="voucher_by_ref"),
+    path(
+        "vms/api/vouchers/ref/<str:voucher_ref>/redeem/",
+        RedeemVoucherView.as_view(), name="redeem_voucher_by_ref"
+    ),
+    path("vms/api/redemptions/offline/sync/", OfflineRedemptionSyncView.as_view(), name="sync_offline_redemptions"),
     re_path(r"^vms/approve_request/(?P<request_ref>.+)/$", approve_request_view, name="approve_request_view"),
     path("vms/request_approved_success/", request_approved_success_view, name="request_approved_success"),
     path("vms/not-found/", not_found_view, name="not_found"),
 
+    # ------------------- exports (streamed csv / ndjson) ----------------
+    path("vms/api/exports/vouchers/", VoucherExportView.as_view(), name="export_vouchers"),
+    path("vms/api/exports/redemptions/", RedemptionExportView.as_view(), name="export_redemptions"),
+    path("vms/api/exports/voucher_requests/", VoucherRequestExportView.as_view(), name="export_voucher_requests"),
+
+    # ------- images stored in the database, addressed by content hash ----------
+    path(
+        "vms/api/assets/company_logos/<int:pk>/<str:digest>/",
+        CompanyLogoView.as_view(), name="company_logo"
+    ),
+    path("vms/api/assets/client_logos/<int:pk>/<str:digest>/", ClientLogoView.as_view(), name="client_logo"),
+    path("vms/api/assets/signatures/<int:pk>/<str:digest>/", UserSignatureView.as_view(), name="user_signature"),
+
     #only for mobile app
     path("vms/api/all_companies/", CompanyList.as_view(), name="all_companies"),
     path("vms/api/all_shops/", ShopList.as_view(), name="all_shops"),
@@ -1,27 +1,70 @@
 from django.contrib.auth.models import Group
+import json
 import logging
 
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 from .models import AuditTrail
+from .audit import audit_writer
 from datetime import datetime, date
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
 
-def logs_audit_action(instance, action, description, user):
-    """ log audit after create, update and delete and object in the database"""
-    try:
-        AuditTrail.objects.create(
+# never copied into the audit trail: secrets, bookkeeping, and the blobs (their *_hash is)
+AUDIT_IGNORED_FIELDS = {'password', 'last_login', 'updated_at'}
+
+
+def logs_audit_action(instance, action, description, user, changes=None):
+    """ log audit after create, update and delete and object in the database (written by batches, see audit.py)"""
+    audit_writer.log([
+        AuditTrail(
+            user=user,
+            table_name=instance.__class__.__name__,
+            object_id=instance.pk,
+            description=description,
+            changes=changes,
+            action=action,
+        )
+    ])
+
+
+def logs_audit_actions(entries, action, user):
+    """ log audit for several objects at once: entries are (instance, description) pairs"""
+    audit_writer.log([
+        AuditTrail(
             user=user,
             table_name=instance.__class__.__name__,
             object_id=instance.pk,
             description=description,
             action=action,
         )
-    except Exception as e:
-        logger.error(f"Erreur lors de l'enregistrement de l'audit pour {instance}: {e}")
+        for instance, description in entries
+    ])
+
+
+def audit_snapshot(instance):
+    """ the audited values of `instance`, from memory: its columns and the pks of its many-to-many """
+    values = {}
+    for field in instance._meta.concrete_fields:
+        if field.name in AUDIT_IGNORED_FIELDS or isinstance(field, models.BinaryField):
+            continue
+        value = field.value_from_object(instance)
+        if isinstance(field, models.FileField):
+            value = value.name or None
+        values[field.name] = value
+    for field in instance._meta.many_to_many:
+        values[field.name] = sorted(related.pk for related in field.value_from_object(instance))
+    return values
+
+
+def audit_changes(before, after):
+    """ {field: [old, new]} for the fields that changed between two audit_snapshot(), JSON ready """
+    changes = {name: [before.get(name), value] for name, value in after.items() if before.get(name) != value}
+    return json.loads(json.dumps(changes, cls=DjangoJSONEncoder))
 
 
 def validate_and_format_date(date_input):
@@ -105,3 +148,22 @@ def notify_requests_approvers(request_ref):
         context={"request_ref": request_ref, "base_url": settings.BASE_URL, "greeting": get_greeting()},
     )
     send_email_to_approvers(html_content, text_content)
+
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def guess_image_content_type(data):
+    """ content type of an image stored in a binary field, from its first bytes """
+    data = bytes(data[:12])
+    for signature, content_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
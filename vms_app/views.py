@@ -1,21 +1,22 @@
 import base64
-import json
 import requests
 from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import Group, Permission
-from django.db import IntegrityError, DatabaseError
-from django.http import JsonResponse
+from django.db import IntegrityError, DatabaseError, transaction
+from django.db.models import Q
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.utils import timezone
 from django.utils.timezone import localtime
-from drf_spectacular.utils import extend_schema, OpenApiResponse
+from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiParameter
 from rest_framework.decorators import permission_classes, api_view
 from rest_framework.exceptions import NotFound, NotAuthenticated, PermissionDenied
 from rest_framework.permissions import (IsAdminUser, IsAuthenticated, AllowAny)
 from rest_framework import (filters, generics, viewsets, status)
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.files.uploadedfile import UploadedFile
 
@@ -28,7 +29,14 @@ from rest_framework.views import APIView
 
 logger = logging.getLogger(__name__)
 
-from .utils import logs_audit_action
+from .utils import logs_audit_action, logs_audit_actions, audit_snapshot, audit_changes, guess_image_content_type
+from .filters import VoucherRefSearchFilter, FullTextSearchFilter, SparseFieldsetFilter
+from .idempotency import idempotent
+from .exports import ExportFormat, stream_export
+from .renderers import ExportRenderer, CSVRenderer, NDJSONRenderer
+from .conditional import ConditionalGetMixin, ConditionalViewSetMixin
+from .caching import CachedCatalogMixin
+from .backends import get_cached_permissions
 from .permissions import (
     RedeemVoucherPermissions,
     CustomDjangoModelPermissions,
@@ -43,26 +51,28 @@ from vms_app.serializers import (
     ClientCrudSerializer, ClientListSerializer,
     RedemptionSerializer, PermissionsListSerializer,
     GroupCustomSerializer, AuditTrailsSerializer,
+    BatchRedemptionSerializer, OfflineRedemptionSyncSerializer,
 )
 from .models import (
     User, Client, Shop,
     VoucherRequest, Voucher,
     Company, Redemption, AuditTrail,
+    RedemptionConflict,
 )
 from .paginations import (
-    VoucherRequestPagination, VoucherPagination,
-    ClientsPagination, UserPagination
+    VoucherRequestPagination, ClientVoucherRequestsPagination, VoucherPagination,
+    ClientsPagination, UserPagination, AuditTrailPagination
 )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ConditionalViewSetMixin, viewsets.ModelViewSet):
     """created, read, update, delete users:
     view only for authenticated users with rights permissions
     """
-    queryset = User.objects.all()
+    queryset = User.objects.prefetch_related('groups', 'user_permissions').defer('signature')
     serializer_class = UserSerializer
     pagination_class = UserPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, SparseFieldsetFilter]
     search_fields = ['email']
     filterset_fields = ['company']
     permission_classes = [
@@ -86,33 +96,22 @@ class UserViewSet(viewsets.ModelViewSet):
 
         return response
 
-    def update(self, request, *args, **kwargs):
-        # old user data before update
-        user = self.get_object()
-        old_data = UserSerializer(user).data
-        old_data.pop('password', None)
+    def perform_update(self, serializer):
+        # user data before update
+        user = serializer.instance
+        before = audit_snapshot(user)
 
         # update
-        response = super().update(request, *args, **kwargs)
-        # new user_data
-        new_data = UserSerializer(user).data
-        new_data.pop('password', None)
-
-        # format logs
-        description = (
-            f"Updated user:\nBefore:\n{json.dumps(old_data, indent=4)}\n"
-            f"After:\n{json.dumps(new_data, indent=4)}"
-        )
-        authenticated_user = request.user
+        super().perform_update(serializer)
 
-        # Log the audit action for update
+        # Log the audit action for update: the changed fields only
         logs_audit_action(
             instance=user,
             action=AuditTrail.AuditTrailsAction.UPDATE,
-            description=description,
-            user=authenticated_user
+            description=f"Updated user '{user.username}'",
+            user=self.request.user,
+            changes=audit_changes(before, audit_snapshot(user)),
         )
-        return response
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -130,10 +129,9 @@ class UserViewSet(viewsets.ModelViewSet):
 @permission_classes(IsAuthenticated)
 def get_user_perms(request, pk):
     try:
-        user = User.objects.get(pk=pk)
-        user_perms = Permission.objects.filter(user=user).values_list('codename', flat=True)
-        group_perms = Permission.objects.filter(group__user=user).values_list('codename', flat=True)
-        all_perms = list(set(user_perms) | set(group_perms))  # Combine permissions
+        user = User.objects.only('id').get(pk=pk)
+        # user and group permissions combined, from the cache
+        all_perms = [permission.split('.', 1)[1] for permission in get_cached_permissions(user.pk)]
         return JsonResponse({
             'current_user_permissions': all_perms,
         })
@@ -149,7 +147,7 @@ class VoucherRequestListView(generics.ListAPIView):
     queryset = VoucherRequest.objects.all()
     serializer_class = VoucherRequestListSerializer
     pagination_class = VoucherRequestPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, SparseFieldsetFilter]
     search_fields = ['request_ref']
     filterset_fields = ['request_status']
     permission_classes = [
@@ -158,7 +156,7 @@ class VoucherRequestListView(generics.ListAPIView):
     ]
 
 
-class VoucherRequestCrudView(generics.GenericAPIView):
+class VoucherRequestCrudView(ConditionalGetMixin, generics.GenericAPIView):
     queryset = VoucherRequest.objects.all()
     serializer_class = VoucherRequestCrudSerializer
     permission_classes = [
@@ -172,13 +170,16 @@ class VoucherRequestCrudView(generics.GenericAPIView):
         if not pk:
             raise NotFound(detail="VoucherRequest ID not provided")
         try:
-            return self.queryset.get(pk=pk)
+            return self.filter_queryset(self.get_queryset()).get(pk=pk)
         except VoucherRequest.DoesNotExist:
             raise NotFound(detail="VoucherRequest not found")
 
     def get(self, request, *args, **kwargs):
+        return self.conditional_retrieve(request, self.retrieve, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
         voucher_request = self.get_object()
-        serializer = self.serializer_class(voucher_request)
+        serializer = self.get_serializer(voucher_request)
         return Response(serializer.data)
 
     @extend_schema(
@@ -315,6 +316,7 @@ class VoucherRequestCreateView(generics.CreateAPIView):
         CustomDjangoModelPermissions
     ]
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         try:
             data = request.data.copy()  # Simple copy, no need flatten_querydict ehre
@@ -355,9 +357,9 @@ class VoucherRequestCreateView(generics.CreateAPIView):
 
 class ClientListView(generics.ListAPIView):
     """display a list of all clients"""
-    queryset = Client.objects.all()
+    queryset = Client.objects.defer('logo')
     serializer_class = ClientListSerializer
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [filters.SearchFilter, SparseFieldsetFilter]
     pagination_class = ClientsPagination
     search_fields = ['email']
     permission_classes = [
@@ -366,10 +368,12 @@ class ClientListView(generics.ListAPIView):
     ]
 
 
-class ClientCRUDView(generics.GenericAPIView):
+class ClientCRUDView(ConditionalGetMixin, generics.GenericAPIView):
     queryset = Client.objects.all()
     serializer_class = ClientCrudSerializer
-    filter_backends = [filters.SearchFilter]
+    # the client detail embeds its latest voucher requests
+    validator_fields = ('updated_at', 'client_voucher_requests__updated_at')
+    filter_backends = [filters.SearchFilter, SparseFieldsetFilter]
     permission_classes = [
         IsAuthenticated,
         CustomDjangoModelPermissions
@@ -378,11 +382,14 @@ class ClientCRUDView(generics.GenericAPIView):
     def get_object(self):
         """ find a client by id """
         try:
-            return self.queryset.get(pk=self.kwargs['pk'])
+            return self.filter_queryset(self.get_queryset()).get(pk=self.kwargs['pk'])
         except Client.DoesNotExist:
             raise NotFound(detail="client not found")
 
     def get(self, request, *args, **kwargs):
+        return self.conditional_retrieve(request, self.retrieve, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
         client = self.get_object()
         serializer = self.get_serializer(client)
         return Response(serializer.data)
@@ -390,19 +397,18 @@ class ClientCRUDView(generics.GenericAPIView):
     def put(self, request, *args, **kwargs):
         authenticated_user = request.user
         client = self.get_object()
-        old_data = ClientCrudSerializer(client).data
+        # the client's own fields only: its voucher requests are not part of the update
+        before = audit_snapshot(client)
 
         serializer = self.get_serializer(client, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            new_data = serializer.data
-            description = (
-                f"Updated client data:\nBefore:\n{json.dumps(old_data, indent=4)}\n"
-                f"After:\n{json.dumps(new_data, indent=4)}"
-            )
 
-            # Log the audit action after update
-            logs_audit_action(client, AuditTrail.AuditTrailsAction.UPDATE, description, authenticated_user)
+            # Log the audit action after update: the changed fields only
+            logs_audit_action(
+                client, AuditTrail.AuditTrailsAction.UPDATE, f"Updated client '{client.clientname}'",
+                authenticated_user, changes=audit_changes(before, audit_snapshot(client)),
+            )
 
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -420,6 +426,22 @@ class ClientCRUDView(generics.GenericAPIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class ClientVoucherRequestsView(generics.ListAPIView):
+    """paginated voucher requests of a client, latest first"""
+    serializer_class = VoucherRequestListSerializer
+    pagination_class = ClientVoucherRequestsPagination
+    queryset = VoucherRequest.objects.all()
+    permission_classes = [
+        IsAuthenticated,
+        CustomDjangoModelPermissions
+    ]
+
+    def get_queryset(self):
+        if not Client.objects.filter(pk=self.kwargs['pk']).exists():
+            raise NotFound(detail="client not found")
+        return self.queryset.filter(client_id=self.kwargs['pk']).order_by('-date_time_recorded', '-id')
+
+
 class ClientCreateView(generics.CreateAPIView):
     queryset = Client.objects.all()
     serializer_class = ClientCrudSerializer
@@ -453,16 +475,24 @@ class ClientCreateView(generics.CreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class VoucherViewSet(viewsets.ModelViewSet):
+class VoucherViewSet(ConditionalViewSetMixin, viewsets.ModelViewSet):
     """
         created, read, update, delete Vouchers:
         view only for authenticated users with rights permissions
     """
-    queryset = Voucher.objects.all()
+    # the nested redemption (shop, company, user) is loaded with the voucher in a single query
+    queryset = Voucher.objects.select_related(
+        'redemption__shop__company', 'redemption__user'
+    ).defer('redemption__user__signature')
     serializer_class = VoucherSerializer
     pagination_class = VoucherPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    search_fields = ['voucher_ref']
+    # the nested redemption shows the shop, company and user names
+    validator_fields = (
+        'updated_at', 'redemption__updated_at', 'redemption__shop__updated_at',
+        'redemption__shop__company__updated_at', 'redemption__user__updated_at',
+    )
+    filter_backends = [DjangoFilterBackend, VoucherRefSearchFilter, SparseFieldsetFilter]
+    search_fields = ['voucher_ref__startswith']
     filterset_fields = [
         'voucher_status', 'redemption__shop',
         'redemption__redemption_date', "voucher_request"
@@ -472,11 +502,11 @@ class VoucherViewSet(viewsets.ModelViewSet):
     ]
 
     def get_object(self):
-        """ find a client by id """
+        """ find a voucher by id """
         try:
-            return self.queryset.get(pk=self.kwargs['pk'])
-        except Client.DoesNotExist:
-            raise NotFound(detail="client not found")
+            return self.filter_queryset(self.get_queryset()).get(pk=self.kwargs['pk'])
+        except Voucher.DoesNotExist:
+            raise NotFound(detail="voucher not found")
 
     def destroy(self, request, *args, **kwargs):
         voucher = self.get_object()
@@ -493,13 +523,30 @@ class VoucherViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CompanyViewSet(viewsets.ModelViewSet):
+class VoucherByRefView(generics.RetrieveAPIView):
+    """Find a voucher by its printed voucher_ref (exact match on the unique index)."""
+    queryset = VoucherViewSet.queryset
+    serializer_class = VoucherSerializer
+    lookup_field = 'voucher_ref'
+    permission_classes = [
+        IsAuthenticated, CustomDjangoModelPermissions
+    ]
+
+
+class CompanyViewSet(ConditionalViewSetMixin, viewsets.ModelViewSet):
     queryset = Company.objects.all()
     serializer_class = CompanySerializer
     permission_classes = [IsAuthenticated, CustomDjangoModelPermissions]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, SparseFieldsetFilter]
     search_fields = ['company_name']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # listed companies only carry their logo hash and url
+            queryset = queryset.defer('company_logo')
+        return queryset
+
     def perform_create(self, serializer):
         company = serializer.save()
         logs_audit_action(
@@ -551,25 +598,86 @@ class CompanyViewSet(viewsets.ModelViewSet):
 
 # this view only returns a list of all companies without authentication
 # (necessary to allow mobile app users to set up the app(select the company))
-class CompanyList(generics.ListAPIView):
-    queryset = Company.objects.all()
+class CompanyList(CachedCatalogMixin, generics.ListAPIView):
+    queryset = Company.objects.defer('company_logo')
     serializer_class = CompanySerializer
     permission_classes = [AllowAny]
 
 
 # this view only returns a list of all shops without authentication
 # (necessary to allow mobile app users to set up the app(select the shop))
-class ShopList(generics.ListAPIView):
-    queryset = Shop.objects.all()
+class ShopList(CachedCatalogMixin, generics.ListAPIView):
+    queryset = Shop.objects.select_related('company').defer('company__company_logo')
     serializer_class = ShopSerializer
+    filter_backends = [DjangoFilterBackend, SparseFieldsetFilter]
     filterset_fields = ['company']
     permission_classes = [AllowAny]
 
 
-class ShopViewSet(viewsets.ModelViewSet):
-    queryset = Shop.objects.all()
+class BinaryAssetView(generics.GenericAPIView):
+    """
+    Serve an image stored in a binary field, addressed by the sha256 of its content:
+    the url changes with the content, so the response can be cached for good, and
+    `If-None-Match` is answered from the hash alone (304) without loading the image.
+    """
+    blob_field = None
+    hash_field = None
+    cache_control = "private, max-age=31536000, immutable"
+    permission_classes = [
+        IsAuthenticated,
+        CustomDjangoModelPermissions
+    ]
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(description="the image"),
+            304: OpenApiResponse(description="not modified (If-None-Match matches the ETag)"),
+            404: OpenApiResponse(description="no such image (or it has changed since)"),
+        }
+    )
+    def get(self, request, pk, digest):
+        current_digest = self.get_queryset().filter(pk=pk).values_list(self.hash_field, flat=True).first()
+        if not current_digest or current_digest != digest:
+            raise NotFound(detail="image not found")
+
+        etag = f'"{digest}"'
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponseNotModified()
+        else:
+            blob = self.get_queryset().filter(pk=pk).values_list(self.blob_field, flat=True).first()
+            if not blob:
+                raise NotFound(detail="image not found")
+            response = HttpResponse(bytes(blob), content_type=guess_image_content_type(blob))
+        response["ETag"] = etag
+        response["Cache-Control"] = self.cache_control
+        return response
+
+
+class CompanyLogoView(BinaryAssetView):
+    """company logos are public, like the companies list (mobile app setup)"""
+    queryset = Company.objects.all()
+    blob_field = "company_logo"
+    hash_field = "company_logo_hash"
+    cache_control = "public, max-age=31536000, immutable"
+    permission_classes = [AllowAny]
+
+
+class ClientLogoView(BinaryAssetView):
+    queryset = Client.objects.all()
+    blob_field = "logo"
+    hash_field = "logo_hash"
+
+
+class UserSignatureView(BinaryAssetView):
+    queryset = User.objects.all()
+    blob_field = "signature"
+    hash_field = "signature_hash"
+
+
+class ShopViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
+    queryset = Shop.objects.select_related('company').defer('company__company_logo')
     serializer_class = ShopSerializer
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, SparseFieldsetFilter]
     filterset_fields = ['company']
     permission_classes = [
         IsAuthenticated,
@@ -582,14 +690,145 @@ class ShopViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
-class RedemptionViewSet(viewsets.ModelViewSet):
-    queryset = Redemption.objects.all()
+class RedemptionViewSet(ConditionalViewSetMixin, viewsets.ModelViewSet):
+    queryset = Redemption.objects.select_related('shop__company', 'user').defer('user__signature')
     serializer_class = RedemptionSerializer
+    validator_fields = ('updated_at', 'shop__updated_at', 'shop__company__updated_at', 'user__updated_at')
+    permission_classes = [
+        IsAuthenticated,
+        CustomDjangoModelPermissions
+    ]
+
+
+class ExportView(generics.GenericAPIView):
+    """
+    Stream the (filtered) rows of a table as CSV, or NDJSON with ?export_format=ndjson
+    (or Accept: application/x-ndjson), ordered by id. `columns` maps the exported headers
+    to field paths (joined in SQL).
+    """
+    columns = {}
+    export_name = None
+    filter_backends = [DjangoFilterBackend]
+    pagination_class = None
+    # CSV first: the format of the clients accepting anything
+    renderer_classes = [CSVRenderer, NDJSONRenderer, *api_settings.DEFAULT_RENDERER_CLASSES]
     permission_classes = [
         IsAuthenticated,
         CustomDjangoModelPermissions
     ]
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "export_format", str, enum=list(ExportFormat.content_types), default=ExportFormat.CSV
+            ),
+        ],
+        responses={
+            200: OpenApiResponse(description="the rows, streamed (CSV with a header line, or one JSON object per line)"),
+            400: OpenApiResponse(description="unknown export_format"),
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get("export_format", self.accepted_export_format())
+        if export_format not in ExportFormat.content_types:
+            return Response(
+                {"detail": f"export_format must be one of: {', '.join(ExportFormat.content_types)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = self.filter_queryset(self.get_queryset()).order_by("id")
+        response = StreamingHttpResponse(
+            stream_export(queryset, self.columns, export_format),
+            content_type=ExportFormat.content_types[export_format]
+        )
+        filename = f"{self.export_name}-{timezone.localdate():%Y%m%d}.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    def accepted_export_format(self):
+        renderer = self.request.accepted_renderer
+        return renderer.format if isinstance(renderer, ExportRenderer) else ExportFormat.CSV
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if isinstance(response, Response) and isinstance(response.accepted_renderer, ExportRenderer):
+            # the errors are not rows: answered in JSON whatever the format asked for
+            renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+            response.accepted_renderer = renderer
+            response.accepted_media_type = renderer.media_type
+        return response
+
+
+class VoucherExportView(ExportView):
+    queryset = Voucher.objects.all()
+    export_name = "vouchers"
+    filterset_fields = {
+        "voucher_status": ["exact"],
+        "redemption__shop": ["exact"],
+        "redemption__redemption_date": ["exact", "gte", "lt"],
+        "voucher_request": ["exact"],
+    }
+    columns = {
+        "id": "id",
+        "voucher_ref": "voucher_ref",
+        "amount": "amount",
+        "voucher_status": "voucher_status",
+        "date_time_created": "date_time_created",
+        "expiry_date": "expiry_date",
+        "extention_date": "extention_date",
+        "request_ref": "voucher_request__request_ref",
+        "redeemed_on": "redemption__redemption_date",
+        "company": "redemption__shop__company__company_name",
+        "shop": "redemption__shop__location",
+        "till_no": "redemption__till_no",
+        "redeemed_by": "redemption__user__username",
+    }
+
+
+class RedemptionExportView(ExportView):
+    queryset = Redemption.objects.all()
+    export_name = "redemptions"
+    filterset_fields = {
+        "shop": ["exact"],
+        "redemption_date": ["exact", "gte", "lt"],
+        "voucher__voucher_request": ["exact"],
+    }
+    columns = {
+        "id": "id",
+        "voucher_ref": "voucher__voucher_ref",
+        "amount": "voucher__amount",
+        "redeemed_on": "redemption_date",
+        "company": "shop__company__company_name",
+        "shop": "shop__location",
+        "till_no": "till_no",
+        "redeemed_by": "user__username",
+    }
+
+
+class VoucherRequestExportView(ExportView):
+    queryset = VoucherRequest.objects.all()
+    export_name = "voucher_requests"
+    filterset_fields = {
+        "request_status": ["exact"],
+        "client": ["exact"],
+        "company": ["exact"],
+        "date_time_recorded": ["gte", "lt"],
+    }
+    columns = {
+        "id": "id",
+        "request_ref": "request_ref",
+        "request_status": "request_status",
+        "client": "client__clientname",
+        "company": "company__company_name",
+        "amount": "amount",
+        "quantity_of_vouchers": "quantity_of_vouchers",
+        "validity_periode": "validity_periode",
+        "date_time_recorded": "date_time_recorded",
+        "date_time_paid": "date_time_paid",
+        "date_time_approved": "date_time_approved",
+        "recorded_by": "recorded_by__username",
+        "approved_by": "approved_by__username",
+    }
+
 
 class RedeemVoucherView(generics.GenericAPIView):
     serializer_class = VoucherSerializer
@@ -601,52 +840,59 @@ class RedeemVoucherView(generics.GenericAPIView):
 
     @extend_schema(
         request=VoucherSerializer,
-        responses={201: VoucherSerializer}
+        responses={
+            201: VoucherSerializer,
+            400: OpenApiResponse(description="The voucher is not 'issued' or 'shop_id' is missing"),
+            404: OpenApiResponse(description="Voucher or shop not found"),
+            409: OpenApiResponse(description="The voucher has already been redeemed (e.g. by another till)"),
+        }
     )
+    @idempotent
     def post(self, request, *args, **kwargs):
         authenticated_user = request.user
         try:
-            voucher = self.get_object()
-            if voucher.voucher_status != Voucher.VoucherStatus.ISSUED:
+            if "shop_id" not in request.data:
                 return Response(
-                    {"details": "Voucher must have the status 'ISSUED' to be redeemed."},
+                    {"details": "The 'shop_id' field is required."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            if "shop_id" not in request.data:
+            # only the columns needed to redeem and to build the response
+            voucher = self.queryset.only(
+                "id", "voucher_ref", "amount", "voucher_status"
+            ).get(**self.voucher_lookup())
+            # an already redeemed voucher is a conflict (409), raised by Voucher.redeem
+            if voucher.voucher_status not in (Voucher.VoucherStatus.ISSUED, Voucher.VoucherStatus.REDEEMED):
                 return Response(
-                    {"details": "The 'shop_id' field is required."},
+                    {"details": "Voucher must have the status 'ISSUED' to be redeemed."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
             # check if there is a shop with the id provided in request.data
-            shop = Shop.objects.get(pk=request.data["shop_id"])
+            try:
+                shop = Shop.objects.select_related("company").get(pk=request.data["shop_id"])
+            except (TypeError, ValueError):
+                return Response(
+                    {"details": "The 'shop_id' field must be a shop id."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             till_no = request.data.get("till_no")
 
             # redeem the voucher
-            voucher.redeem(user=request.user, shop=shop, till_no=till_no)
+            redemption = voucher.redeem(user=authenticated_user, shop=shop, till_no=till_no)
 
             # response when the voucher was redeemed successfully
-            redemption = {
-                "redeemed_on": voucher.redemption.redemption_date,
-                "redeemed_at": f"{voucher.redemption.shop.company.company_name} {voucher.redemption.shop.location}",
-            }
-            redemption_date = localtime(redemption["redeemed_on"])
-            formatted_date = redemption_date.strftime('%d %b %Y, %H:%M')
+            voucher_info = redemption_voucher_info(voucher, redemption)
             # log audit for after redemption
-            description = (
-                f"Redemption for voucher: {voucher.voucher_ref}.\n redeemed at: "
-                f" {redemption['redeemed_at']}.\n On '{formatted_date}'"
+            logs_audit_action(
+                redemption, AuditTrail.AuditTrailsAction.ADD,
+                redemption_audit_description(voucher, voucher_info["redemption"]),
+                authenticated_user
             )
-            logs_audit_action(voucher.redemption, AuditTrail.AuditTrailsAction.ADD, description, authenticated_user)
             return Response(
                 {
                     "details": f"Voucher '{voucher.voucher_ref}' was redeemed successfully.",
-                    "voucher_info": {
-                        "voucher_ref": voucher.voucher_ref,
-                        "amount": voucher.amount,
-                        "redemption": redemption,
-                    },
+                    "voucher_info": voucher_info,
                 },
                 status=status.HTTP_201_CREATED
             )
@@ -654,6 +900,8 @@ class RedeemVoucherView(generics.GenericAPIView):
             return Response({"details": "Voucher not found."}, status=status.HTTP_404_NOT_FOUND)
         except Shop.DoesNotExist:
             return Response({"details": "Shop not found."}, status=status.HTTP_404_NOT_FOUND)
+        except RedemptionConflict as e:
+            return Response({"details": str(e)}, status=status.HTTP_409_CONFLICT)
         except KeyError as e:
             return Response({"details": f"Missing field: {e}"}, status=status.HTTP_400_BAD_REQUEST)
         except NotAuthenticated as e:
@@ -670,6 +918,281 @@ class RedeemVoucherView(generics.GenericAPIView):
         except Exception as e:
             return Response({"details": f"Sorry something went wrong"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def voucher_lookup(self):
+        """ the voucher is identified either by its id or by its voucher_ref """
+        if "voucher_ref" in self.kwargs:
+            return {"voucher_ref": self.kwargs["voucher_ref"]}
+        return {"pk": self.kwargs["pk"]}
+
+
+def redemption_voucher_info(voucher, redemption):
+    """
+    'voucher_info' payload returned after a redemption, built from the objects
+    already in memory (the shop must be loaded with its company).
+    """
+    shop = redemption.shop
+    return {
+        "voucher_ref": voucher.voucher_ref,
+        "amount": voucher.amount,
+        "redemption": {
+            "redeemed_on": redemption.redemption_date,
+            "redeemed_at": f"{shop.company.company_name} {shop.location}",
+        },
+    }
+
+
+def redemption_audit_description(voucher, redemption_info):
+    formatted_date = localtime(redemption_info["redeemed_on"]).strftime('%d %b %Y, %H:%M')
+    return (
+        f"Redemption for voucher: {voucher.voucher_ref}.\n redeemed at: "
+        f" {redemption_info['redeemed_at']}.\n On '{formatted_date}'"
+    )
+
+
+class BatchRedeemVoucherView(generics.GenericAPIView):
+    """
+    Redeem several vouchers (a till's whole basket) in one call and one transaction.
+    Each voucher gets its own result; in 'all_or_nothing' mode a single failure
+    cancels the whole batch, in 'partial' mode the other vouchers are still redeemed.
+    """
+    serializer_class = BatchRedemptionSerializer
+    queryset = Voucher.objects.all()
+    permission_classes = [
+        IsAuthenticated,
+        RedeemVoucherPermissions
+    ]
+
+    @extend_schema(
+        request=BatchRedemptionSerializer,
+        responses={
+            201: OpenApiResponse(description="At least one voucher was redeemed; see 'results'"),
+            400: OpenApiResponse(description="Invalid input, or no voucher could be redeemed"),
+            404: OpenApiResponse(description="Shop not found"),
+            409: OpenApiResponse(description="Nothing redeemed: some vouchers were already redeemed"),
+        }
+    )
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        partial = data["mode"] == BatchRedemptionSerializer.RedemptionMode.PARTIAL
+
+        try:
+            shop = Shop.objects.select_related("company").get(pk=data["shop_id"])
+        except Shop.DoesNotExist:
+            return Response({"details": "Shop not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        requested = data["vouchers"]
+        results, redeemable = self.check_vouchers(requested)
+
+        redemptions = []
+        if redeemable and (partial or len(redeemable) == len(requested)):
+            with transaction.atomic():
+                redemptions, conflicts = Voucher.redeem_many(
+                    list(redeemable), request.user, shop, data.get("till_no")
+                )
+                for voucher in conflicts:
+                    results[redeemable[voucher]] = redemption_failure(
+                        "already_redeemed", "Voucher has already been redeemed."
+                    )
+                if conflicts and not partial:
+                    # all or nothing: cancel the redemptions done in this batch
+                    transaction.set_rollback(True)
+                    redemptions = []
+
+        audit_entries = []
+        for redemption in redemptions:
+            voucher = redemption.voucher
+            voucher_info = redemption_voucher_info(voucher, redemption)
+            results[redeemable[voucher]] = {"status": "redeemed", "voucher_info": voucher_info}
+            audit_entries.append(
+                (redemption, redemption_audit_description(voucher, voucher_info["redemption"]))
+            )
+        if audit_entries:
+            logs_audit_actions(audit_entries, AuditTrail.AuditTrailsAction.ADD, request.user)
+
+        for index in redeemable.values():
+            if results[index] is None:
+                # all or nothing: this voucher was valid but another one of the batch failed
+                results[index] = redemption_failure(
+                    "not_redeemed", "Not redeemed because another voucher of the batch failed."
+                )
+
+        if redemptions:
+            response_status = status.HTTP_201_CREATED
+        elif any(result["status"] == "already_redeemed" for result in results):
+            response_status = status.HTTP_409_CONFLICT
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(
+            {
+                "details": f"{len(redemptions)} of {len(requested)} vouchers were redeemed.",
+                "mode": data["mode"],
+                "redeemed": len(redemptions),
+                "results": [
+                    {"voucher": item, **result} for item, result in zip(requested, results)
+                ],
+            },
+            status=response_status
+        )
+
+    def check_vouchers(self, requested):
+        """
+        Load all the requested vouchers with one query and check their status.
+        Returns the results list (aligned with `requested`, None where the voucher
+        can be redeemed) and the redeemable vouchers mapped to their position.
+        """
+        ids = [item for item in requested if isinstance(item, int)]
+        refs = [item for item in requested if isinstance(item, str)]
+        vouchers = list(self.queryset.filter(
+            Q(pk__in=ids) | Q(voucher_ref__in=refs)
+        ).only("id", "voucher_ref", "amount", "voucher_status"))
+        by_id = {voucher.pk: voucher for voucher in vouchers}
+        by_ref = {voucher.voucher_ref: voucher for voucher in vouchers}
+
+        results, redeemable, seen = [], {}, set()
+        for item in requested:
+            voucher = by_id.get(item) if isinstance(item, int) else by_ref.get(item)
+            result = None
+            if voucher is None:
+                result = redemption_failure("not_found", "Voucher not found.")
+            elif voucher.pk in seen:
+                result = redemption_failure("duplicate", "Voucher appears more than once in the batch.")
+            elif voucher.voucher_status == Voucher.VoucherStatus.REDEEMED:
+                result = redemption_failure("already_redeemed", "Voucher has already been redeemed.")
+            elif voucher.voucher_status != Voucher.VoucherStatus.ISSUED:
+                result = redemption_failure("not_issued", "Voucher must have the status 'ISSUED' to be redeemed.")
+            else:
+                redeemable[voucher] = len(results)
+            if voucher is not None:
+                seen.add(voucher.pk)
+            results.append(result)
+        return results, redeemable
+
+
+def redemption_failure(failure_status, details):
+    return {"status": failure_status, "details": details}
+
+
+class OfflineRedemptionSyncView(generics.GenericAPIView):
+    """
+    Upload the redemptions a till recorded while it was offline.
+
+    The redemptions are applied in chronological order with set-based queries
+    (same rules as an online redemption). A voucher already redeemed, online or
+    by an earlier offline redemption, is reported as a conflict with the
+    redemption that was kept; the other redemptions are still applied.
+    """
+    serializer_class = OfflineRedemptionSyncSerializer
+    queryset = Redemption.objects.all()
+    permission_classes = [
+        IsAuthenticated,
+        RedeemVoucherPermissions
+    ]
+
+    @extend_schema(
+        request=OfflineRedemptionSyncSerializer,
+        responses={
+            200: OpenApiResponse(description="Redemptions processed; see 'results' for applied, conflicting and rejected ones"),
+            400: OpenApiResponse(description="Invalid input"),
+        }
+    )
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        entries = serializer.validated_data["redemptions"]
+
+        vouchers = {
+            voucher.voucher_ref: voucher
+            for voucher in Voucher.objects.filter(
+                voucher_ref__in={entry["voucher_ref"] for entry in entries}
+            ).only("id", "voucher_ref", "amount", "voucher_status")
+        }
+        shops = Shop.objects.select_related("company").in_bulk({entry["shop_id"] for entry in entries})
+        # a redemption can only be attributed to a colleague: a user of the caller's company
+        users = {}
+        if request.user.company_id:
+            users = User.objects.filter(company_id=request.user.company_id).in_bulk(
+                {entry["user_id"] for entry in entries if "user_id" in entry}
+            )
+        users[request.user.pk] = request.user
+        allowed_user_ids = {
+            user_id for user_id, user in users.items()
+            if user.is_active and user.has_perm('vms_app.redeem_voucher')
+        }
+
+        results = [None] * len(entries)
+        pending = []
+        # chronological order decides which redemption wins when a voucher appears twice
+        for index in sorted(range(len(entries)), key=lambda i: entries[i]["redeemed_at"]):
+            entry = entries[index]
+            voucher = vouchers.get(entry["voucher_ref"])
+            user_id = entry.get("user_id", request.user.pk)
+            if voucher is None:
+                results[index] = redemption_failure("rejected", "Voucher not found.")
+            elif entry["shop_id"] not in shops:
+                results[index] = redemption_failure("rejected", "Shop not found.")
+            elif user_id not in allowed_user_ids:
+                results[index] = redemption_failure(
+                    "rejected", "This user is not allowed to redeem vouchers for your company."
+                )
+            elif voucher.voucher_status not in (Voucher.VoucherStatus.ISSUED, Voucher.VoucherStatus.REDEEMED):
+                results[index] = redemption_failure(
+                    "rejected", "Voucher must have the status 'ISSUED' to be redeemed."
+                )
+            else:
+                redemption = Redemption(
+                    voucher=voucher, user=users[user_id], shop=shops[entry["shop_id"]],
+                    till_no=entry.get("till_no"), redemption_date=entry["redeemed_at"]
+                )
+                redemption.sync_index = index
+                pending.append(redemption)
+
+        applied, conflicts = Voucher.apply_redemptions(pending) if pending else ([], [])
+
+        audit_entries = []
+        for redemption in applied:
+            voucher_info = redemption_voucher_info(redemption.voucher, redemption)
+            results[redemption.sync_index] = {"status": "redeemed", "voucher_info": voucher_info}
+            audit_entries.append((
+                redemption,
+                f"Offline {redemption_audit_description(redemption.voucher, voucher_info['redemption'])}"
+                f" (till {redemption.till_no}, redeemed by {redemption.user.username})"
+            ))
+        if audit_entries:
+            logs_audit_actions(audit_entries, AuditTrail.AuditTrailsAction.ADD, request.user)
+
+        if conflicts:
+            kept_redemptions = {
+                redemption.voucher_id: redemption
+                for redemption in Redemption.objects.select_related("shop__company").filter(
+                    voucher_id__in={conflict.voucher_id for conflict in conflicts}
+                )
+            }
+            for conflict in conflicts:
+                kept = kept_redemptions.get(conflict.voucher_id)
+                result = redemption_failure("conflict", "Voucher has already been redeemed.")
+                if kept:
+                    result["redemption"] = redemption_voucher_info(conflict.voucher, kept)["redemption"]
+                results[conflict.sync_index] = result
+
+        return Response(
+            {
+                "details": f"{len(applied)} of {len(entries)} offline redemptions were applied.",
+                "applied": len(applied),
+                "conflicts": len(conflicts),
+                "results": [
+                    {"local_id": entry.get("local_id"), "voucher_ref": entry["voucher_ref"], **result}
+                    for entry, result in zip(entries, results)
+                ],
+            },
+            status=status.HTTP_200_OK
+        )
+
 
 class GroupViewSet(viewsets.ModelViewSet):
     queryset = Group.objects.all()
@@ -696,9 +1219,28 @@ class PermissionListViewSet(generics.ListAPIView):
     ]
 
 
-class AuditTrailsViewset(viewsets.ModelViewSet):
-    queryset = AuditTrail.objects.all()
+class AuditTrailsViewset(ConditionalViewSetMixin, viewsets.ModelViewSet):
+    """
+    Audit trail, latest entries first, filtered by object (`table_name` + `object_id`),
+    `user`, `action` and `datetime__gte`/`datetime__lt`, and searched with `?search=`
+    (full text on PostgreSQL). Cursor pages by default: counting tens of millions of
+    rows is what makes the page numbers slow (`?pagination=page` to get them anyway).
+    """
+    queryset = AuditTrail.objects.select_related('user').defer('user__signature').order_by('-datetime', '-id')
     serializer_class = AuditTrailsSerializer
+    pagination_class = AuditTrailPagination
+    pagination_mode = AuditTrailPagination.CURSOR
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, SparseFieldsetFilter]
+    filterset_fields = {
+        'table_name': ['exact'],
+        'object_id': ['exact'],
+        'user': ['exact'],
+        'action': ['exact'],
+        'datetime': ['gte', 'lt'],
+    }
+    search_fields = ['description']
+    # entries are never modified, only added (but they show the username of their user)
+    validator_fields = ('datetime', 'user__updated_at')
     permission_classes = [
         IsAuthenticated,
         IsAdminUser, CustomDjangoModelPermissions